@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+プロジェクトのアーカイブ
+
+処理済みプロジェクトをバックグラウンドで .wbpz (zip) に圧縮する
+次のプロジェクトのソルバー実行と並行して動き、
+再生成可能なソルバーのスクラッチファイルを除外したり、
+チェックサムのマニフェストを出力したりできる
+"""
+
+import os
+import fnmatch
+import hashlib
+import logging
+import zipfile
+from datetime import datetime
+
+from config import ARCHIVE_CONFIG
+from fs_utils import format_bytes
+from workers import WorkerPool
+
+
+class ProjectArchiver(object):
+    """
+    バックグラウンドのアーカイブ処理
+
+    submit() で処理済みプロジェクトを投入し、
+    全プロジェクトの処理後に wait() で完了を待って統計を取得する
+    """
+    def __init__(self, logger):
+        # type: (logging.Logger) -> None
+        self.logger = logger
+        self.pool = WorkerPool(ARCHIVE_CONFIG.get("max_workers", 2), name="archiver")
+        self.tasks = []  # type: list
+        self.results = []  # type: list
+
+    def submit(self, project_path):
+        # type: (str) -> None
+        """プロジェクトのアーカイブを投入"""
+        self.logger.info("Queued project for archiving: {}".format(project_path))
+        self.tasks.append(self.pool.submit(archive_project, project_path, self.logger))
+
+    def wait(self):
+        # type: () -> list
+        """投入済みのアーカイブ処理の完了を待ち、結果リストを返す"""
+        if self.tasks:
+            self.logger.info("Waiting for {} archive job(s) to finish...".format(
+                len([task for task in self.tasks if not task.done()])
+            ))
+        for task in self.tasks:
+            self.results.append(task.result())
+        self.tasks = []
+        self.pool.shutdown(wait=True)
+        return self.results
+
+    def format_section(self):
+        # type: () -> str
+        """全体完了通知に載せるアーカイブの統計"""
+        lines = []
+        lines.append("アーカイブ:")
+
+        succeeded = [r for r in self.results if r["success"]]
+        failed = [r for r in self.results if not r["success"]]
+        lines.append("  作成: {} / {}".format(len(succeeded), len(self.results)))
+
+        if succeeded:
+            source_bytes = sum(r["source_bytes"] for r in succeeded)
+            archive_bytes = sum(r["archive_bytes"] for r in succeeded)
+            excluded_bytes = sum(r["excluded_bytes"] for r in succeeded)
+            seconds = sum(r["seconds"] for r in succeeded)
+            throughput = (source_bytes - excluded_bytes) / seconds if seconds > 0 else 0
+
+            lines.append("  元のサイズ: {}".format(format_bytes(source_bytes)))
+            lines.append("  アーカイブサイズ: {}".format(format_bytes(archive_bytes)))
+            lines.append("  削減量: {}（うちスクラッチ除外 {}）".format(
+                format_bytes(source_bytes - archive_bytes), format_bytes(excluded_bytes)
+            ))
+            lines.append("  スループット: {}/秒".format(format_bytes(throughput)))
+
+        for r in failed:
+            lines.append("  [FAILED] {}: {}".format(r["project"], r["error"]))
+
+        return "\n".join(lines)
+
+
+def archive_project(project_path, logger):
+    # type: (str, logging.Logger) -> dict
+    """
+    1つのプロジェクトを .wbpz に圧縮
+
+    .wbpj と {プロジェクト名}_files フォルダを zip にまとめる
+
+    Args:
+        project_path (str): プロジェクトファイル (.wbpj) のパス
+        logger (logging.Logger): ロガーインスタンス
+
+    Returns:
+        dict: アーカイブ結果
+            {
+                "project": str,
+                "archive": str or None,
+                "success": bool,
+                "error": str or None,
+                "source_bytes": int,    # 元のファイルの合計サイズ
+                "excluded_bytes": int,  # 除外したスクラッチファイルの合計サイズ
+                "archive_bytes": int,   # アーカイブのサイズ
+                "seconds": float,
+            }
+    """
+    result = {
+        "project": os.path.basename(project_path),
+        "archive": None,
+        "success": False,
+        "error": None,
+        "source_bytes": 0,
+        "excluded_bytes": 0,
+        "archive_bytes": 0,
+        "seconds": 0.0,
+    }
+    start_time = datetime.now()
+    archive_path = _get_archive_path(project_path)
+    temp_path = archive_path + ".part"
+
+    try:
+        project_dir = os.path.dirname(os.path.abspath(project_path))
+        exclude_patterns = []
+        if ARCHIVE_CONFIG.get("exclude_scratch", True):
+            exclude_patterns = ARCHIVE_CONFIG.get("scratch_patterns", [])
+
+        included, excluded = _collect_files(project_path, exclude_patterns)
+        result["source_bytes"] = sum(size for _, size in included + excluded)
+        result["excluded_bytes"] = sum(size for _, size in excluded)
+
+        logger.info("Archiving {} ({} file(s), {} excluded as scratch)...".format(
+            result["project"], len(included), len(excluded)
+        ))
+
+        manifest = []
+        vanished = []
+        archive = zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        try:
+            for path, _ in included:
+                arcname = os.path.relpath(path, project_dir)
+                # Workbench がプロジェクトを閉じる際に消えるファイルは飛ばす
+                # （ZipFile.write は元のファイルを開いてからエントリを書き込む）
+                try:
+                    checksum = None
+                    if ARCHIVE_CONFIG.get("write_manifest", True):
+                        checksum = _sha256_file(path)
+                    archive.write(path, arcname)
+                except (IOError, OSError):
+                    if path == project_path:
+                        raise
+                    vanished.append(path)
+                    continue
+                if checksum is not None:
+                    manifest.append((checksum, arcname.replace(os.sep, "/")))
+        finally:
+            archive.close()
+
+        if vanished:
+            logger.warning("Skipped {} file(s) that disappeared while archiving {}".format(
+                len(vanished), result["project"]
+            ))
+
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        os.rename(temp_path, archive_path)
+
+        if ARCHIVE_CONFIG.get("write_manifest", True):
+            _write_manifest(archive_path, manifest)
+
+        result["archive"] = archive_path
+        result["archive_bytes"] = os.path.getsize(archive_path)
+        result["success"] = True
+        result["seconds"] = (datetime.now() - start_time).total_seconds()
+
+        logger.info("Archive created: {} ({} -> {}, {:.1f} s)".format(
+            archive_path, format_bytes(result["source_bytes"]),
+            format_bytes(result["archive_bytes"]), result["seconds"]
+        ))
+    except Exception as e:
+        result["error"] = str(e)
+        result["seconds"] = (datetime.now() - start_time).total_seconds()
+        logger.error("Failed to archive {}: {}".format(result["project"], str(e)))
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    return result
+
+
+def is_scratch_file(filename, patterns):
+    # type: (str, list) -> bool
+    """ファイル名がスクラッチファイルのパターンに一致するか（大文字小文字を区別しない）"""
+    name = filename.lower()
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern.lower()):
+            return True
+    return False
+
+
+def _collect_files(project_path, exclude_patterns):
+    # type: (str, list) -> tuple
+    """
+    アーカイブ対象のファイルを収集
+
+    Returns:
+        tuple: (included, excluded) いずれも (パス, サイズ) のリスト
+    """
+    included = [(project_path, os.path.getsize(project_path))]
+    excluded = []
+
+    name = os.path.splitext(os.path.basename(project_path))[0]
+    files_dir = os.path.join(os.path.dirname(os.path.abspath(project_path)), name + "_files")
+    if not os.path.isdir(files_dir):
+        return included, excluded
+
+    exclude_dirs = set(name.lower() for name in ARCHIVE_CONFIG.get("exclude_dirs", []))
+    for dirpath, dirnames, filenames in os.walk(files_dir):
+        # 作業用のディレクトリ（_ProjectScratch など）は辿らない
+        dirnames[:] = [d for d in dirnames if d.lower() not in exclude_dirs]
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            try:
+                entry = (path, os.path.getsize(path))
+            except OSError:
+                # 一覧の取得後に消えたファイル（ロックファイルなど）
+                continue
+            if is_scratch_file(filename, exclude_patterns):
+                excluded.append(entry)
+            else:
+                included.append(entry)
+
+    return included, excluded
+
+
+def _get_archive_path(project_path):
+    # type: (str) -> str
+    """アーカイブファイルのパスを生成"""
+    output_dir = ARCHIVE_CONFIG.get("output_dir") or os.path.dirname(project_path)
+    name = os.path.splitext(os.path.basename(project_path))[0]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(output_dir, "{}_{}.wbpz".format(name, timestamp))
+
+
+def _sha256_file(path):
+    # type: (str) -> str
+    """ファイルの SHA-256 を計算"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_manifest(archive_path, manifest):
+    # type: (str, list) -> None
+    """
+    チェックサムのマニフェストを {アーカイブ}.sha256 に出力
+
+    sha256sum と同じ形式で、アーカイブ内の各ファイルとアーカイブ自体を記載する
+    """
+    lines = ["{}  {}".format(checksum, arcname) for checksum, arcname in manifest]
+    lines.append("{}  {}".format(_sha256_file(archive_path), os.path.basename(archive_path)))
+    with open(archive_path + ".sha256", "w") as f:
+        f.write("\n".join(lines) + "\n")
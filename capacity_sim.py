@@ -0,0 +1,611 @@
+# -*- coding: utf-8 -*-
+r"""
+キャパシティシミュレーター
+
+実行履歴（および過去のログファイル）に記録された処理時間を再生し、
+同時実行数・ライセンス数・スケジューリング方針を変えた場合の
+所要時間（メイクスパン）と稼働率を離散イベントシミュレーションで予測する
+Workbench は不要で、通常の Python で数秒で実行できる
+
+モデル:
+    project: 各ワーカーが1プロジェクトずつ Open -> 設計ポイントを順に更新 -> Save
+             （main() を複数並べた場合に相当）
+    dp:      プロジェクトは1つずつ Open / Save し、設計ポイントをワーカー間で並列に更新
+             （process_project の設計ポイントループを並列化した場合に相当）
+    いずれも設計ポイントの更新中は1ライセンスを使用する
+
+使用方法:
+    python capacity_sim.py --workers 1 2 4 8 --licenses 4
+    python capacity_sim.py --level dp --policy lpt --log C:\Scripts\logs\ansys_batch_*.log
+"""
+
+import os
+import re
+import sys
+import glob
+import gzip
+import heapq
+import random
+import argparse
+from collections import deque
+from datetime import datetime
+
+from run_history import load_runs, get_history_file
+
+
+# スケジューリング方針
+POLICIES = ("fifo", "lpt", "spt")
+
+# ログ行の形式: "2025-12-26 10:00:00 - AnsysBatchRunner - INFO - メッセージ"
+_LOG_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - \S+ - \w+ - (.*)$")
+
+# ローテーション済みのセグメント: {ログファイル名}.N または {ログファイル名}.N.gz
+_LOG_SEGMENT = re.compile(r"^(.*?)(?:\.(\d+)(?:\.gz)?)?$")
+
+
+# ============================================================
+# 履歴の読み込み
+# ============================================================
+
+def parse_log_file(path):
+    # type: (str) -> list
+    """
+    ログファイルから実行履歴レコードを復元
+
+    実行履歴 (run_history.jsonl) を記録する前のログからも処理時間を取り出せるようにする
+    ローテーション済みのセグメント ({ログファイル名}.N.gz) も同じ実行としてまとめて読む
+
+    Args:
+        path (str): ログファイル、またはそのローテーション済みセグメントのパス
+
+    Returns:
+        list: 実行履歴レコードのリスト（run_history.build_run_record と同じ形式）
+    """
+    return parse_log_files([path])
+
+
+def parse_log_files(paths):
+    # type: (list) -> list
+    """
+    複数のログファイルから実行履歴レコードを復元
+
+    ログファイルごとに、ディスク上のローテーション済みセグメントも含めて
+    古い順 (.N.gz, ..., .1.gz, .log) に1つの流れとして読み、START 行でのみ実行を区切る
+
+    Args:
+        paths (list): ログファイルのパスのリスト（セグメントを直接指定してもよい）
+
+    Returns:
+        list: 実行履歴レコードのリスト
+    """
+    runs = []
+    for segments in _group_log_segments(paths):
+        lines = []
+        for segment in segments:
+            opener = gzip.open if segment.endswith(".gz") else open
+            with opener(segment, "rb") as f:
+                lines.extend(f.read().decode("utf-8", "replace").splitlines())
+        runs.extend(_parse_log_lines(lines))
+    return runs
+
+
+def _group_log_segments(paths):
+    # type: (list) -> list
+    """
+    ログファイルのパスをローテーション前の名前ごとにまとめる
+
+    Returns:
+        list: 古い順に並べたセグメントのパスのリストのリスト
+    """
+    groups = {}
+    order = []
+    for path in paths:
+        base = _LOG_SEGMENT.match(path).group(1)
+        if base in groups:
+            continue
+        groups[base] = {}
+        order.append(base)
+
+        directory = os.path.dirname(base) or "."
+        prefix = os.path.basename(base)
+        for filename in os.listdir(directory):
+            if not filename.startswith(prefix):
+                continue
+            match = _LOG_SEGMENT.match(filename)
+            if match.group(1) != prefix:
+                continue
+            number = int(match.group(2)) if match.group(2) else 0
+            groups[base][number] = os.path.join(os.path.dirname(base), filename)
+
+    # 番号が大きいほど古いセグメント、番号なしが現在のファイル
+    return [[groups[base][n] for n in sorted(groups[base], reverse=True)]
+            for base in order if groups[base]]
+
+
+def _parse_log_lines(lines):
+    # type: (list) -> list
+    """1回分以上の実行のログ行から実行履歴レコードを復元"""
+    runs = []
+    run = None
+    project = None
+    marks = {}
+
+    for line in lines:
+        match = _LOG_LINE.match(line)
+        if not match:
+            continue
+        timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
+        message = match.group(2)
+
+        # 最も古いセグメントが削除済みで START 行がない場合は、最初の行から実行を始める
+        if run is None or message.endswith("Batch Runner - START"):
+            run = {"started": match.group(1), "finished": None,
+                   "elapsed_seconds": None, "projects": []}
+            runs.append(run)
+            project = None
+
+        if message.endswith("Batch Runner - COMPLETED"):
+            run["finished"] = match.group(1)
+            started = datetime.strptime(run["started"], "%Y-%m-%d %H:%M:%S")
+            run["elapsed_seconds"] = (timestamp - started).total_seconds()
+            continue
+
+        if message.startswith("Processing project: "):
+            path_value = message[len("Processing project: "):]
+            project = {"project": os.path.basename(path_value), "path": path_value,
+                       "success": False, "elapsed_seconds": None,
+                       "open_seconds": None, "save_seconds": None, "dps": []}
+            run["projects"].append(project)
+            marks = {"project": timestamp}
+            continue
+
+        if project is None:
+            continue
+
+        if message == "Opening project...":
+            marks["open"] = timestamp
+        elif message == "Project opened successfully" and "open" in marks:
+            project["open_seconds"] = (timestamp - marks["open"]).total_seconds()
+        elif message.startswith("Updating design points "):
+            # まとめて更新（"Updating design points 3, 4 together..."）
+            names = message[len("Updating design points "):].split(" together")[0]
+            marks["dp"] = timestamp
+            marks["batch"] = [name.strip() for name in names.split(",")]
+        elif message.startswith("Updating design point "):
+            marks["dp"] = timestamp
+            marks.pop("batch", None)
+        elif message.startswith("Design point ") and " is already retained" in message:
+            name = message.split()[2]
+            project["dps"].append({"name": name, "seconds": 0.0,
+                                   "success": True, "skipped": True})
+        elif message.startswith("Design point ") and (
+                message.endswith("updated successfully")
+                or message.endswith("update completed but not retained")):
+            name = message.split()[2]
+            project["dps"].append(_dp_entry(
+                name, timestamp, marks, message.endswith("updated successfully")
+            ))
+        elif message.startswith("Failed to update design point "):
+            name = message[len("Failed to update design point "):].split(":")[0]
+            project["dps"].append(_dp_entry(name, timestamp, marks, False))
+        elif message == "Saving project...":
+            marks["save"] = timestamp
+        elif message.startswith("Project saved") and "save" in marks:
+            project["save_seconds"] = (timestamp - marks["save"]).total_seconds()
+        elif message.startswith("Project processing completed"):
+            project["success"] = message.endswith("successfully")
+            project["elapsed_seconds"] = (timestamp - marks["project"]).total_seconds()
+
+    return runs
+
+
+def _dp_entry(name, timestamp, marks, success):
+    # type: (str, datetime, dict, bool) -> dict
+    """
+    ログの結果行から設計ポイントの記録を作成
+
+    まとめて更新した設計ポイントは run_projects と同じく seconds を None にし、
+    全体の時間を batch_seconds に記録する
+    """
+    seconds = (timestamp - marks.get("dp", timestamp)).total_seconds()
+    entry = {"name": name, "seconds": seconds, "success": success, "skipped": False}
+    batch = marks.get("batch")
+    if batch and name in batch:
+        entry["seconds"] = None
+        entry["batch_seconds"] = seconds
+        entry["batch_size"] = len(batch)
+    return entry
+
+
+def build_profiles(runs, latest_only=True):
+    # type: (list, bool) -> list
+    """
+    実行履歴からプロジェクトごとの処理時間プロファイルを作成
+
+    Args:
+        runs (list): 古い順の実行履歴レコードのリスト
+        latest_only (bool): True の場合、最新の実行に含まれるプロジェクトのみを対象とする
+
+    Returns:
+        list: プロファイルのリスト（最新の実行での処理順）
+            {
+                "project": str,
+                "open": list,       # Open の所要時間（秒）の観測値
+                "save": list,       # Save の所要時間（秒）の観測値
+                "dps": list,        # [(設計ポイント名, 所要時間の観測値リスト)]
+                "failure_rate": float,
+            }
+    """
+    profiles = {}
+    order = []
+
+    for run in runs:
+        for project in run.get("projects", []):
+            if project.get("open_seconds") is None and not project.get("dps"):
+                continue
+            key = project.get("path") or project["project"]
+            profile = profiles.get(key)
+            if profile is None:
+                profile = {"project": project["project"], "open": [], "save": [],
+                           "dp_names": [], "dp_seconds": {}, "attempts": 0, "failures": 0}
+                profiles[key] = profile
+                order.append(key)
+
+            if project.get("open_seconds") is not None:
+                profile["open"].append(project["open_seconds"])
+            if project.get("save_seconds") is not None:
+                profile["save"].append(project["save_seconds"])
+
+            # 設計ポイントの構成は最新の実行に合わせる
+            names = [dp["name"] for dp in project.get("dps", [])]
+            if names:
+                profile["dp_names"] = names
+            for dp in project.get("dps", []):
+                # まとめて更新した設計ポイントは1つあたりの時間が分からないため対象外
+                if dp.get("skipped") or dp.get("batch_size", 1) > 1:
+                    continue
+                profile["dp_seconds"].setdefault(dp["name"], []).append(dp["seconds"])
+                profile["attempts"] += 1
+                if not dp.get("success"):
+                    profile["failures"] += 1
+
+    if latest_only and runs:
+        latest_keys = []
+        for project in runs[-1].get("projects", []):
+            key = project.get("path") or project["project"]
+            if key in profiles and key not in latest_keys:
+                latest_keys.append(key)
+        if latest_keys:
+            order = latest_keys
+
+    result = []
+    for key in order:
+        profile = profiles[key]
+        # 毎回更新済みでスキップされている設計ポイントは対象外
+        dps = []
+        for name in profile["dp_names"]:
+            observed = profile["dp_seconds"].get(name)
+            if observed:
+                dps.append((name, observed))
+        result.append({
+            "project": profile["project"],
+            "open": profile["open"] or [0.0],
+            "save": profile["save"] or [0.0],
+            "dps": dps,
+            "failure_rate": (float(profile["failures"]) / profile["attempts"]
+                             if profile["attempts"] else 0.0),
+        })
+    return result
+
+
+# ============================================================
+# 離散イベントシミュレーション
+# ============================================================
+
+class _Engine(object):
+    """イベントを時刻順に処理する最小限のシミュレーションエンジン"""
+    def __init__(self):
+        # type: () -> None
+        self.now = 0.0
+        self._events = []  # type: list
+        self._seq = 0
+
+    def schedule(self, delay, callback):
+        # type: (float, callable) -> None
+        """delay 秒後に callback を呼ぶ"""
+        heapq.heappush(self._events, (self.now + delay, self._seq, callback))
+        self._seq += 1
+
+    def run(self):
+        # type: () -> float
+        """全イベントを処理し、最後のイベントの時刻を返す"""
+        while self._events:
+            self.now, _, callback = heapq.heappop(self._events)
+            callback()
+        return self.now
+
+
+class _Resource(object):
+    """
+    容量付きの資源（ワーカー・ライセンス）
+
+    空きがなければ要求順に待たせ、使用量の時間積分から稼働率を求める
+    """
+    def __init__(self, engine, capacity):
+        # type: (_Engine, float) -> None
+        self.engine = engine
+        self.capacity = capacity
+        self.in_use = 0
+        self.busy_time = 0.0
+        self._waiters = deque()
+        self._last = 0.0
+
+    def acquire(self, callback):
+        # type: (callable) -> None
+        """空きができ次第 callback を呼ぶ"""
+        if self.in_use < self.capacity:
+            self._account()
+            self.in_use += 1
+            callback()
+        else:
+            self._waiters.append(callback)
+
+    def release(self):
+        # type: () -> None
+        """資源を返却し、待っている要求があれば引き渡す"""
+        self._account()
+        if self._waiters:
+            self.engine.schedule(0.0, self._waiters.popleft())
+        else:
+            self.in_use -= 1
+
+    def _account(self):
+        # type: () -> None
+        self.busy_time += self.in_use * (self.engine.now - self._last)
+        self._last = self.engine.now
+
+
+def simulate(profiles, workers, licenses=None, level="project", policy="fifo",
+             failure_cost=1.0, seed=0):
+    # type: (list, int, int, str, str, float, int) -> dict
+    """
+    1回分のバッチ実行をシミュレーション
+
+    Args:
+        profiles (list): build_profiles の戻り値
+        workers (int): 同時に処理するプロジェクト数 (project) または設計ポイント数 (dp)
+        licenses (int): ソルバーライセンス数（None の場合は無制限）
+        level (str): "project" または "dp"
+        policy (str): "fifo"（設定順）, "lpt"（長いものから）, "spt"（短いものから）
+        failure_cost (float): 失敗した設計ポイントが消費する時間の割合
+        seed (int): 乱数シード
+
+    Returns:
+        dict: {"makespan": float, "worker_utilization": float,
+               "license_utilization": float, "failed_dps": int}
+    """
+    rng = random.Random(seed)
+    engine = _Engine()
+    worker_pool = _Resource(engine, workers)
+    license_pool = _Resource(engine, licenses if licenses else float("inf"))
+    stats = {"failed_dps": 0, "solve_time": 0.0}
+
+    # 各プロジェクトの処理時間をサンプリング（観測値からのブートストラップ）
+    jobs = []
+    for profile in profiles:
+        dps = []
+        for _, observed in profile["dps"]:
+            seconds = rng.choice(observed)
+            if rng.random() < profile["failure_rate"]:
+                seconds *= failure_cost
+                stats["failed_dps"] += 1
+            dps.append(seconds)
+        jobs.append({
+            "open": rng.choice(profile["open"]),
+            "save": rng.choice(profile["save"]),
+            "dps": _order(dps, policy, key=lambda s: s),
+        })
+    jobs = _order(jobs, policy, key=lambda j: j["open"] + sum(j["dps"]) + j["save"])
+
+    if level == "dp":
+        _simulate_dp_level(engine, worker_pool, license_pool, jobs, stats)
+    else:
+        _simulate_project_level(engine, worker_pool, license_pool, jobs, stats)
+
+    makespan = engine.run()
+    worker_pool._account()
+    license_pool._account()
+
+    worker_capacity = workers * makespan
+    license_capacity = (licenses if licenses else workers) * makespan
+    return {
+        "makespan": makespan,
+        "worker_utilization": worker_pool.busy_time / worker_capacity if worker_capacity else 0.0,
+        "license_utilization": stats["solve_time"] / license_capacity if license_capacity else 0.0,
+        "failed_dps": stats["failed_dps"],
+    }
+
+
+def _order(items, policy, key):
+    # type: (list, str, callable) -> list
+    """スケジューリング方針に従って並べ替え"""
+    if policy == "lpt":
+        return sorted(items, key=key, reverse=True)
+    if policy == "spt":
+        return sorted(items, key=key)
+    return list(items)
+
+
+def _simulate_project_level(engine, worker_pool, license_pool, jobs, stats):
+    # type: (_Engine, _Resource, _Resource, list, dict) -> None
+    """各ワーカーが1プロジェクトずつ順に処理するモデル"""
+    def start_project(job):
+        def run_dp(index):
+            if index >= len(job["dps"]):
+                engine.schedule(job["save"], worker_pool.release)
+                return
+
+            def solve():
+                seconds = job["dps"][index]
+                stats["solve_time"] += seconds
+
+                def finish():
+                    license_pool.release()
+                    run_dp(index + 1)
+                engine.schedule(seconds, finish)
+            license_pool.acquire(solve)
+
+        engine.schedule(job["open"], lambda: run_dp(0))
+
+    for job in jobs:
+        worker_pool.acquire(lambda job=job: start_project(job))
+
+
+def _simulate_dp_level(engine, worker_pool, license_pool, jobs, stats):
+    # type: (_Engine, _Resource, _Resource, list, dict) -> None
+    """プロジェクトは順に処理し、設計ポイントをワーカー間で並列に更新するモデル"""
+    def start_project(index):
+        if index >= len(jobs):
+            return
+        job = jobs[index]
+        remaining = [len(job["dps"])]
+
+        def save():
+            def finish_save():
+                worker_pool.release()
+                start_project(index + 1)
+            worker_pool.acquire(lambda: engine.schedule(job["save"], finish_save))
+
+        def dp_done():
+            license_pool.release()
+            worker_pool.release()
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                save()
+
+        def dispatch_dps():
+            worker_pool.release()
+            if not job["dps"]:
+                save()
+                return
+            for seconds in job["dps"]:
+                def solve(seconds=seconds):
+                    stats["solve_time"] += seconds
+                    engine.schedule(seconds, dp_done)
+                worker_pool.acquire(lambda solve=solve: license_pool.acquire(solve))
+
+        worker_pool.acquire(lambda: engine.schedule(job["open"], dispatch_dps))
+
+    start_project(0)
+
+
+def run_scenarios(profiles, worker_counts, licenses=None, level="project", policy="fifo",
+                  replications=50, failure_cost=1.0, seed=0):
+    # type: (list, list, int, str, str, int, float, int) -> list
+    """
+    ワーカー数ごとに複数回シミュレーションして集計
+
+    Returns:
+        list: ワーカー数ごとの集計結果
+    """
+    results = []
+    for workers in worker_counts:
+        samples = [
+            simulate(profiles, workers, licenses, level, policy, failure_cost, seed + i)
+            for i in range(replications)
+        ]
+        makespans = sorted(s["makespan"] for s in samples)
+        results.append({
+            "workers": workers,
+            "makespan_mean": sum(makespans) / len(makespans),
+            "makespan_p90": makespans[min(len(makespans) - 1, int(0.9 * len(makespans)))],
+            "worker_utilization": sum(s["worker_utilization"] for s in samples) / len(samples),
+            "license_utilization": sum(s["license_utilization"] for s in samples) / len(samples),
+        })
+    return results
+
+
+# ============================================================
+# コマンドライン
+# ============================================================
+
+def format_report(results, profiles, licenses, level, policy, observed_seconds=None):
+    # type: (list, list, int, str, str, float) -> str
+    """シミュレーション結果を表形式に整形"""
+    lines = []
+    lines.append("Capacity simulation: level={}, policy={}, licenses={}".format(
+        level, policy, licenses if licenses else "unlimited"
+    ))
+    lines.append("Projects: {}, design points: {}".format(
+        len(profiles), sum(len(p["dps"]) for p in profiles)
+    ))
+    if observed_seconds:
+        lines.append("Observed makespan (latest run): {}".format(_format_hours(observed_seconds)))
+    lines.append("")
+    lines.append("{:>7}  {:>12}  {:>12}  {:>8}  {:>11}  {:>12}".format(
+        "workers", "makespan", "p90", "speedup", "worker util", "license util"
+    ))
+
+    base = results[0]["makespan_mean"] if results else 0.0
+    for r in results:
+        speedup = base / r["makespan_mean"] if r["makespan_mean"] else 0.0
+        lines.append("{:>7}  {:>12}  {:>12}  {:>7.2f}x  {:>10.0%}  {:>11.0%}".format(
+            r["workers"], _format_hours(r["makespan_mean"]), _format_hours(r["makespan_p90"]),
+            speedup, r["worker_utilization"], r["license_utilization"]
+        ))
+    return "\n".join(lines)
+
+
+def _format_hours(seconds):
+    # type: (float) -> str
+    """秒を H:MM:SS 形式に整形"""
+    seconds = int(round(seconds))
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+def main(argv=None):
+    # type: (list) -> int
+    """コマンドラインから実行"""
+    parser = argparse.ArgumentParser(
+        description="Predict batch makespan for different worker / license counts"
+    )
+    parser.add_argument("--history", default=None,
+                        help="run history file (default: run_history.jsonl in log_dir)")
+    parser.add_argument("--log", nargs="*", default=[],
+                        help="log files to replay in addition to the run history (globs allowed)")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--licenses", type=int, default=None,
+                        help="solver licenses (default: unlimited)")
+    parser.add_argument("--level", choices=("project", "dp"), default="project")
+    parser.add_argument("--policy", choices=POLICIES, default="fifo")
+    parser.add_argument("--replications", type=int, default=50)
+    parser.add_argument("--failure-cost", type=float, default=1.0,
+                        help="fraction of its duration a failed design point consumes")
+    parser.add_argument("--all-projects", action="store_true",
+                        help="include projects not in the latest run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    log_paths = []
+    for pattern in args.log:
+        log_paths.extend(sorted(glob.glob(pattern)))
+    runs = parse_log_files(log_paths)
+    runs.extend(load_runs(args.history or get_history_file()))
+    runs.sort(key=lambda r: r.get("started") or "")
+
+    profiles = build_profiles(runs, latest_only=not args.all_projects)
+    if not profiles:
+        print("No project timings found in run history or logs")
+        return 1
+
+    results = run_scenarios(
+        profiles, args.workers, args.licenses, args.level, args.policy,
+        args.replications, args.failure_cost, args.seed
+    )
+    print(format_report(results, profiles, args.licenses, args.level, args.policy,
+                        runs[-1].get("elapsed_seconds")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
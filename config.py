@@ -7,9 +7,13 @@
 
 # プロジェクトリスト
 # 処理したい .wbpj ファイルのフルパスを指定
+# 一部の設計ポイントだけを更新する場合や更新順を指定する場合は、
+# {"path": ..., "manifest": {...} または マニフェストの JSON ファイルのパス} の形式で指定
+# （マニフェストの書式は dp_selection.py を参照）
 PROJECTS = [
     r"C:\Work\Project1.wbpj",
     r"C:\Work\Project2.wbpj",
+    # {"path": r"C:\Work\Project3.wbpj", "manifest": {"design_points": ["1-10"]}},
     # 必要に応じて追加
 ]
 
@@ -27,6 +31,15 @@ LOG_CONFIG = {
     # ログファイル名のプレフィックス
     # 実際のファイル名は: {prefix}_YYYYMMDD_HHMMSS.log
     "log_file_prefix": "ansys_batch",
+
+    # ログファイルのローテーション
+    # max_bytes を超えると {ログファイル名}.1.gz, .2.gz, ... に切り替える（0 で無効）
+    "max_bytes": 50 * 1024 * 1024,
+    "backup_count": 10,
+    "compress_rotated": True,
+
+    # 残す実行ログの数（古い実行のログから削除、0 で無制限）
+    "max_log_files": 30,
 }
 
 # メール設定
@@ -49,3 +62,228 @@ EMAIL_CONFIG = {
     "from_addr": "your_email@gmail.com",
     "to_addr": "recipient@example.com",
 }
+
+# メール通知の頻度設定
+NOTIFY_CONFIG = {
+    # "immediate": プロジェクトごとに開始・完了を送信
+    # "digest": 開始・成功の通知をまとめて送信（失敗は即時送信）
+    "mode": "digest",
+
+    # ダイジェストを送る区切り（どちらかに達したら送信）
+    "digest_interval_minutes": 60,
+    "digest_max_events": 20,
+
+    # digest モードで失敗を即時送信するか
+    "send_failures_immediately": True,
+
+    # 1回の実行あたりの送信上限（0 で無制限）
+    # 全体完了通知は上限に関わらず必ず送信する
+    "max_messages": 50,
+    "max_bytes": 20 * 1024 * 1024,
+
+    # max_messages のうち失敗通知のために残しておく通数
+    # ダイジェストや開始通知はこの分を使わないため、後から発生した失敗も送信できる
+    "reserved_failure_messages": 10,
+}
+
+# 事前チェック設定
+PREFLIGHT_CONFIG = {
+    # 処理開始前に全プロジェクトを事前チェックするか
+    "enabled": True,
+
+    # 並列にチェックするスレッド数
+    "max_workers": 8,
+
+    # ログ・バックアップ保存先に必要な空き容量 (MB)
+    # 下回る場合、ログは警告、プロジェクトは後回しにする
+    "min_free_space_mb": 2048,
+
+    # SMTP サーバーへの接続を確認するか
+    "check_smtp": True,
+    "smtp_timeout": 10,
+}
+
+# アーカイブ設定
+ARCHIVE_CONFIG = {
+    # 処理済みプロジェクトをバックグラウンドで .wbpz に圧縮するか
+    "enabled": False,
+
+    # 成功したプロジェクトのみアーカイブするか
+    "only_successful": True,
+
+    # アーカイブの保存先（None の場合はプロジェクトと同じフォルダ）
+    "output_dir": None,
+
+    # 並列に圧縮するスレッド数
+    "max_workers": 2,
+
+    # 再生成可能なソルバーのスクラッチファイルを除外するか
+    "exclude_scratch": True,
+    "scratch_patterns": [
+        "*.esav", "*.full", "*.emat", "*.osav", "*.page",
+        "*.r0*", "*.tmp", "*.lock", "*.dsub",
+    ],
+
+    # アーカイブに含めないディレクトリ（Workbench の作業用ディレクトリ）
+    "exclude_dirs": ["_ProjectScratch"],
+
+    # チェックサムのマニフェスト ({アーカイブ}.sha256) を出力するか
+    "write_manifest": True,
+}
+
+# ソルバーファイル整理設定
+PRUNE_CONFIG = {
+    # 保持済み設計ポイントの中間ファイルを整理するか
+    "enabled": False,
+
+    # 整理のタイミング
+    # "dp": 設計ポイントの更新ごと, "project": プロジェクトの保存前にまとめて
+    "stage": "project",
+
+    # ファイル種別ごとのルール（上から順に最初に一致したものを適用）
+    # 処理: "keep"（残す）, "delete"（削除）, "move"（move_dir に移動）
+    "rules": [
+        ("*.rst", "keep"),
+        ("*.rth", "keep"),
+        ("*.rmg", "keep"),
+        ("*.err", "keep"),
+        ("*.out", "keep"),
+        ("*.esav", "delete"),
+        ("*.full", "delete"),
+        ("*.emat", "delete"),
+        ("*.osav", "delete"),
+        ("*.page", "delete"),
+        ("*.r0*", "delete"),
+        ("*.tmp", "delete"),
+    ],
+
+    # どのルールにも一致しないファイルの処理
+    "default_action": "keep",
+
+    # "move" の移動先（None の場合は削除）
+    "move_dir": None,
+
+    # 保存時間の記録ファイル（None の場合はログディレクトリの prune_state.json）
+    # 整理前と比較できるよう、整理が無効の実行でも記録する
+    "state_file": None,
+}
+
+# 実行履歴設定
+HISTORY_CONFIG = {
+    # プロジェクト・設計ポイントごとの処理時間を記録するか
+    "enabled": True,
+
+    # 記録先（None の場合はログディレクトリの run_history.jsonl）
+    "history_file": None,
+}
+
+# 進捗の公開設定
+PROGRESS_CONFIG = {
+    # 進捗（実行中のプロジェクト・設計ポイント、完了数、残り時間の見込みなど）を公開するか
+    "enabled": True,
+
+    # ステータスファイル (JSON) を書き込むか
+    "write_status_file": True,
+
+    # ステータスファイルのパス（None の場合はログディレクトリの status.json）
+    "status_file": None,
+
+    # ステータスファイルの書き込み間隔（秒）
+    "write_interval_seconds": 5,
+
+    # ローカルの HTTP エンドポイントを開くか（127.0.0.1 のみで待ち受け）
+    # /metrics: Prometheus 形式、/status: JSON
+    "http_enabled": False,
+
+    # HTTP エンドポイントのポート番号
+    "http_port": 9108,
+}
+
+# 稼働時間帯の設定
+SCHEDULE_CONFIG = {
+    # 稼働時間帯の中でだけ処理するか（False の場合は時間帯に関係なく最後まで実行）
+    "enabled": False,
+
+    # 稼働時間帯のリスト
+    # days: "mon-fri" のような範囲、"sat,sun" のような列挙、または "daily"（時間帯が始まる曜日）
+    # start / end: "HH:MM"。end が start 以前の場合は翌日の end まで
+    # concurrency: 同時に更新する設計ポイント数（0 の場合は停止時間帯として他の時間帯より優先）
+    # 日をまたぐ時間帯は始まる曜日で指定するため、日曜の夜から月曜の朝までは "sun" の時間帯が必要
+    "windows": [
+        {"days": "mon-fri", "start": "19:00", "end": "07:00", "concurrency": 1},
+        {"days": "sat,sun", "start": "00:00", "end": "24:00", "concurrency": 2},
+        {"days": "sun", "start": "19:00", "end": "07:00", "concurrency": 1},
+    ],
+
+    # 時間帯の終了までこの分数を切ったら新しい設計ポイントを開始しない
+    # 時間帯は設計ポイント（まとめて更新する場合はそのまとまり）の開始前にだけ確認するため、
+    # 実行中の更新は end を過ぎても最後まで続く。大きなまとまりが end を越えないよう、
+    # 1回の更新にかかる時間を目安に設定する
+    "stop_margin_minutes": 0,
+
+    # 時間帯の外で待機しているときの確認間隔（秒）
+    "check_interval_seconds": 60,
+}
+
+# 性能の退行検出設定
+REGRESSION_CONFIG = {
+    # 今回の処理時間を過去の実行と比較するか（HISTORY_CONFIG の実行履歴を使用）
+    "enabled": True,
+
+    # ベースラインに使う直近の実行数（同じプロジェクトを含む実行）
+    "baseline_runs": 10,
+
+    # 比較に必要な最小のサンプル数
+    "min_samples": 3,
+
+    # 信頼水準（0.95 または 0.99）
+    "confidence": 0.95,
+
+    # 有意と判定する最小の変化率（0.2 = 20%）
+    "min_relative_change": 0.2,
+
+    # これより短い処理時間（秒）は比較しない
+    "min_seconds": 1.0,
+
+    # 比較結果の出力先（None の場合はログディレクトリの regression_report.json）
+    "report_file": None,
+}
+
+# 分散実行の設定
+DISTRIBUTED_CONFIG = {
+    # 複数のノードで共有フォルダの作業キューからプロジェクトを取り出して処理するか
+    # 全ノードで同じ設定のスクリプトを起動する。最初に起動したノードが PROJECTS をキューに登録する
+    "enabled": False,
+
+    # 作業キューを置く共有フォルダ（全ノードから読み書きできること）
+    "queue_dir": r"\\fileserver\ansys\queue",
+
+    # バッチの識別子。同じ識別子のノードが同じキューを使う
+    # None の場合は run_tag と PROJECTS のハッシュから決める（どちらも None の場合はエラー）
+    "batch_id": None,
+
+    # 実行ごとに変えるタグ（例: "2025-12-26-night"）。全ノードで同じ値と PROJECTS を設定する
+    # 完了済みのキューに参加したノードはエラー終了するため、再実行時は新しいタグにする
+    "run_tag": None,
+
+    # ノード名（None の場合は "ホスト名-プロセスID"）
+    # ログ・status.json・run_history.jsonl などノードごとのファイル名にも付ける（None の場合はホスト名）
+    "node_name": None,
+
+    # リースの有効期間（秒）。この間ハートビートがなければ他のノードがプロジェクトを引き取る
+    "lease_seconds": 600,
+
+    # ハートビートの間隔（秒）
+    "heartbeat_seconds": 60,
+
+    # 他のノードの処理完了を待つときの確認間隔（秒）
+    "poll_seconds": 30,
+
+    # リースが期限切れになった回数がこれに達したプロジェクトは失敗として扱う
+    "max_attempts": 3,
+
+    # 共有フォルダの読み書きに失敗したときの試行回数と間隔（秒）
+    # 全て失敗した場合は poll_seconds 後に改めて確認する
+    "io_retries": 3,
+    "io_retry_seconds": 5,
+}
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+設計ポイントの選択
+
+PROJECTS のエントリにマニフェストを付けて、プロジェクトごとに
+更新する設計ポイントの絞り込みと優先順位を指定する
+
+マニフェストの例:
+    {
+        "design_points": [1, 2, "5-10"],   # 対象の設計ポイント ID（省略時は全て）
+        "exclude_design_points": ["8"],    # 対象外の設計ポイント ID
+        "include": [                       # 全て満たすものだけを対象にする
+            {"parameter": "P1", "op": ">=", "value": 10}
+        ],
+        "exclude": [                       # いずれかを満たすものは対象外
+            {"parameter": "P3", "op": "==", "value": 0}
+        ],
+        "priority": {"9": 10, "1-3": 5},   # 大きいものから先に更新（省略時は default_priority）
+        "default_priority": 0
+    }
+"""
+
+import os
+import json
+import logging
+
+
+# フィルタで使用できる比較演算子
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not in": lambda a, b: a not in b,
+}
+
+
+def get_project_path(entry):
+    # type: (object) -> str
+    """
+    PROJECTS のエントリからプロジェクトファイルのパスを取得
+
+    エントリはパス (str)、または {"path": str, "manifest": dict or str} の辞書
+    """
+    if isinstance(entry, dict):
+        return entry["path"]
+    return entry
+
+
+def get_manifest_spec(entry):
+    # type: (object) -> object
+    """PROJECTS のエントリのマニフェスト指定（辞書またはファイルパス）。ない場合は None"""
+    if isinstance(entry, dict):
+        return entry.get("manifest")
+    return None
+
+
+def load_manifest(spec, project_path):
+    # type: (object, str) -> dict
+    """
+    マニフェストを読み込んで検証する
+
+    Args:
+        spec (dict or str): マニフェスト、または JSON ファイルのパス
+            相対パスはプロジェクトファイルのあるディレクトリからのパス
+        project_path (str): プロジェクトファイルのパス
+
+    Returns:
+        dict: 検証済みのマニフェスト。spec が None の場合は None
+
+    Raises:
+        ValueError: マニフェストが読み込めない、または内容が不正な場合
+    """
+    if spec is None:
+        return None
+
+    if not isinstance(spec, dict):
+        manifest_path = spec
+        if not os.path.isabs(manifest_path):
+            manifest_path = os.path.join(
+                os.path.dirname(os.path.abspath(project_path)), manifest_path
+            )
+        try:
+            with open(manifest_path, "r") as f:
+                spec = json.load(f)
+        except (IOError, OSError) as e:
+            raise ValueError("Failed to read manifest {}: {}".format(manifest_path, str(e)))
+        except ValueError as e:
+            raise ValueError("Invalid JSON in manifest {}: {}".format(manifest_path, str(e)))
+        if not isinstance(spec, dict):
+            raise ValueError("Manifest {} must be a JSON object".format(manifest_path))
+
+    manifest = {
+        "design_points": None,
+        "exclude_design_points": _parse_ids(spec.get("exclude_design_points", [])),
+        "include": [_parse_filter(f) for f in spec.get("include", [])],
+        "exclude": [_parse_filter(f) for f in spec.get("exclude", [])],
+        "priority": [],
+        "default_priority": float(spec.get("default_priority", 0)),
+    }
+    if spec.get("design_points") is not None:
+        manifest["design_points"] = _parse_ids(spec["design_points"])
+
+    for key, value in (spec.get("priority") or {}).items():
+        try:
+            manifest["priority"].append((_parse_ids([key]), float(value)))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid priority for design point {}: {}".format(key, value))
+
+    return manifest
+
+
+def select_design_points(design_points, manifest, parameters, logger):
+    # type: (list, dict, object, logging.Logger) -> tuple
+    """
+    マニフェストに従って更新する設計ポイントを選び、優先順位の順に並べる
+
+    Args:
+        design_points (list): GetAllDesignPoints() の戻り値
+        manifest (dict): load_manifest の戻り値。None の場合は全ての設計ポイントを元の順で返す
+        parameters: Workbench の Parameters オブジェクト（パラメータ値のフィルタで使用）
+        logger (logging.Logger): ロガーインスタンス
+
+    Returns:
+        tuple: (selected, skipped)
+            selected (list): (通し番号, 設計ポイント) のリスト（優先順位の高い順、同順位は元の順）
+            skipped (int): マニフェストで対象外になった設計ポイントの数
+    """
+    numbered = list(enumerate(design_points, 1))
+    if manifest is None:
+        return numbered, 0
+
+    selected = []
+    for index, dp in numbered:
+        dp_id = _get_dp_id(dp, index)
+        if manifest["design_points"] is not None and dp_id not in manifest["design_points"]:
+            continue
+        if dp_id in manifest["exclude_design_points"]:
+            continue
+        try:
+            if not all(_matches(dp, f, parameters) for f in manifest["include"]):
+                continue
+            if any(_matches(dp, f, parameters) for f in manifest["exclude"]):
+                continue
+        except Exception as e:
+            logger.warning("Skipping design point {}: failed to evaluate filter: {}".format(
+                dp_id, str(e)
+            ))
+            continue
+        selected.append((_get_priority(manifest, dp_id), index, dp))
+
+    # 優先順位の高い順（同順位は元の順）
+    selected.sort(key=lambda item: (-item[0], item[1]))
+    return [(index, dp) for _, index, dp in selected], len(numbered) - len(selected)
+
+
+def _get_dp_id(dp, index):
+    # type: (object, int) -> int
+    """設計ポイントの ID（dp0 なら 0）。取得できない場合は index - 1"""
+    try:
+        return int(str(dp.Name))
+    except Exception:
+        return index - 1
+
+
+def _get_priority(manifest, dp_id):
+    # type: (dict, int) -> float
+    """設計ポイントの優先順位（最初に一致した指定）"""
+    for ids, priority in manifest["priority"]:
+        if dp_id in ids:
+            return priority
+    return manifest["default_priority"]
+
+
+def _parse_ids(items):
+    # type: (list) -> set
+    """[1, "3", "5-10"] のような ID の指定を ID の集合に変換"""
+    if not isinstance(items, (list, tuple)):
+        items = [items]
+
+    ids = set()
+    for item in items:
+        text = str(item).strip()
+        try:
+            if "-" in text:
+                first, last = [int(part) for part in text.split("-", 1)]
+                if first > last:
+                    raise ValueError(text)
+                ids.update(range(first, last + 1))
+            else:
+                ids.add(int(text))
+        except ValueError:
+            raise ValueError("Invalid design point ID or range: {}".format(item))
+    return ids
+
+
+def _parse_filter(spec):
+    # type: (dict) -> tuple
+    """{"parameter": "P1", "op": ">=", "value": 10} を (パラメータ名, 演算子, 値) に変換"""
+    try:
+        name = spec["parameter"]
+        value = spec["value"]
+    except (KeyError, TypeError):
+        raise ValueError("Filter must have 'parameter' and 'value': {}".format(spec))
+    op = spec.get("op", "==")
+    if op not in _OPERATORS:
+        raise ValueError("Invalid filter operator: {}".format(op))
+    return name, op, value
+
+
+def _matches(dp, filter_spec, parameters):
+    # type: (object, tuple, object) -> bool
+    """設計ポイントのパラメータ値がフィルタを満たすか"""
+    name, op, expected = filter_spec
+    parameter = parameters.GetParameter(Name=name)
+    actual = _to_value(dp.GetParameterValue(Parameter=parameter))
+
+    # 数値で比較できる場合は数値、それ以外は文字列で比較する
+    if isinstance(actual, float):
+        try:
+            if op in ("in", "not in"):
+                expected = [float(item) for item in expected]
+            else:
+                expected = float(expected)
+        except (TypeError, ValueError):
+            actual = str(actual)
+    return _OPERATORS[op](actual, expected)
+
+
+def _to_value(value):
+    # type: (object) -> object
+    """
+    パラメータ値を比較用の値に変換
+
+    単位付きの値 (Quantity) は Value 属性、または "10 [mm]" の数値部分を使う
+    """
+    if hasattr(value, "Value"):
+        value = value.Value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    text = str(value).strip()
+    try:
+        return float(text.split()[0])
+    except (IndexError, ValueError):
+        return text
@@ -119,8 +119,8 @@ def _create_email_body(summary, full_log):
 
 
 def format_summary(total_projects, successful_projects, failed_projects,
-                   project_results, elapsed_time):
-    # type: (int, int, int, list, timedelta) -> str
+                   project_results, elapsed_time, extra_sections=None):
+    # type: (int, int, int, list, timedelta, list) -> str
     """
     処理結果のサマリーを整形
 
@@ -130,6 +130,7 @@ def format_summary(total_projects, successful_projects, failed_projects,
         failed_projects (int): 失敗したプロジェクト数
         project_results (list): プロジェクトごとの結果リスト
         elapsed_time (timedelta): 処理時間
+        extra_sections (list): 末尾に追加するセクション (str) のリスト（オプション）
 
     Returns:
         str: 整形されたサマリー
@@ -155,13 +156,142 @@ def format_summary(total_projects, successful_projects, failed_projects,
             lines.append("  エラー: {}".format(result["error"]))
         if result.get("dp_success") is not None:
             lines.append("  設計ポイント成功: {} / {}".format(
-                result["dp_success"], result["dp_total"]
+                result["dp_success"], result.get("dp_selected", result["dp_total"])
             ))
+        if result.get("dp_skipped"):
+            lines.append("  設計ポイント選択: {} / 対象外: {} / 今回更新: {}".format(
+                result["dp_selected"], result["dp_skipped"], result.get("dp_solved", 0)
+            ))
+        lines.append("")
+
+    # 追加セクション（通知の統計など）
+    for section in extra_sections or []:
+        lines.append(section)
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def format_preflight_summary(report, total_projects):
+    # type: (dict, int) -> str
+    """
+    事前チェック結果のサマリーを整形
+
+    Args:
+        report (dict): preflight.run_preflight の戻り値
+        total_projects (int): 総プロジェクト数
+
+    Returns:
+        str: 整形されたサマリー
+    """
+    lines = []
+
+    lines.append("事前チェック結果")
+    lines.append("")
+    lines.append("総プロジェクト数: {}".format(total_projects))
+    lines.append("実行予定: {}".format(len(report["runnable"])))
+    lines.append("後回し: {}".format(len(report["deferred"])))
+    lines.append("除外: {}".format(len(report["dropped"])))
+    lines.append("チェック時間: {}".format(_format_timedelta(report["elapsed"])))
+    lines.append("")
+
+    if report["batch_issues"]:
+        lines.append("バッチ全体の問題:")
+        for issue in report["batch_issues"]:
+            lines.append("  {}".format(issue))
         lines.append("")
 
+    if report["dropped"]:
+        lines.append("除外したプロジェクト:")
+        lines.append("")
+        for entry in report["dropped"]:
+            lines.append("[DROPPED] {}".format(entry["project"]))
+            for error in entry["errors"]:
+                lines.append("  エラー: {}".format(error))
+            lines.append("")
+
+    if report["deferred"]:
+        lines.append("後回しにしたプロジェクト:")
+        lines.append("")
+        for entry in report["deferred"]:
+            lines.append("[DEFERRED] {}".format(entry["project"]))
+            for warning in entry["warnings"]:
+                lines.append("  警告: {}".format(warning))
+            lines.append("")
+
+    return "\n".join(lines)
+
+
+def create_preflight_subject(report, total_projects):
+    # type: (dict, int) -> str
+    """
+    事前チェック結果のメール件名を作成
+
+    Args:
+        report (dict): preflight.run_preflight の戻り値
+        total_projects (int): 総プロジェクト数
+
+    Returns:
+        str: メール件名
+    """
+    return "[Ansys Batch] PREFLIGHT - {}/{} runnable, {} dropped".format(
+        len(report["runnable"]), total_projects, len(report["dropped"])
+    )
+
+
+def format_digest_summary(events, total_projects, overall_successful, overall_processed):
+    # type: (list, int, int, int) -> str
+    """
+    ダイジェスト通知のサマリーを整形
+
+    Args:
+        events (list): (datetime, str) のイベントリスト
+        total_projects (int): 総プロジェクト数
+        overall_successful (int): これまでに成功したプロジェクト数
+        overall_processed (int): これまでに処理したプロジェクト数
+
+    Returns:
+        str: 整形されたサマリー
+    """
+    lines = []
+
+    lines.append("処理状況ダイジェスト ({} 件)".format(len(events)))
+    lines.append("")
+    for event_time, text in events:
+        lines.append("{} {}".format(
+            event_time.strftime("%Y-%m-%d %H:%M:%S"),
+            text.replace("[Ansys Batch] ", "", 1)
+        ))
+    lines.append("")
+
+    # 全体の進捗
+    lines.append("全体の進捗:")
+    lines.append("  処理済み: {}/{}".format(overall_processed, total_projects))
+    lines.append("  成功: {}".format(overall_successful))
+    lines.append("  失敗: {}".format(overall_processed - overall_successful))
+    lines.append("  残り: {}".format(total_projects - overall_processed))
+
     return "\n".join(lines)
 
 
+def create_digest_subject(event_count, total_projects, overall_processed):
+    # type: (int, int, int) -> str
+    """
+    ダイジェスト通知のメール件名を作成
+
+    Args:
+        event_count (int): ダイジェストに含まれるイベント数
+        total_projects (int): 総プロジェクト数
+        overall_processed (int): これまでに処理したプロジェクト数
+
+    Returns:
+        str: メール件名
+    """
+    return "[Ansys Batch] DIGEST - {}/{} processed - {} event(s)".format(
+        overall_processed, total_projects, event_count
+    )
+
+
 def _format_timedelta(td):
     # type: (timedelta) -> str
     """
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+ファイルシステム関連ユーティリティ
+
+空き容量の取得や JSON ファイルの安全な書き込みなど、
+IronPython / CPython の差異を吸収する処理
+"""
+
+import os
+import json
+import shutil
+
+
+def get_free_bytes(path):
+    # type: (str) -> int
+    """
+    指定パスが属するボリュームの空き容量を取得
+
+    パスがまだ存在しない場合は、存在する親ディレクトリで判定する
+
+    Args:
+        path (str): 対象のファイルまたはディレクトリのパス
+
+    Returns:
+        int: 空き容量（バイト）。取得できない場合は None
+    """
+    target = _existing_parent(path)
+    if target is None:
+        return None
+
+    # Python 3.3 以降
+    if hasattr(shutil, "disk_usage"):
+        try:
+            return shutil.disk_usage(target).free
+        except OSError:
+            return None
+
+    # POSIX
+    if hasattr(os, "statvfs"):
+        try:
+            st = os.statvfs(target)
+            return st.f_bavail * st.f_frsize
+        except OSError:
+            return None
+
+    # Windows (IronPython 2.7)
+    try:
+        import ctypes
+        free_bytes = ctypes.c_ulonglong(0)
+        ok = ctypes.windll.kernel32.GetDiskFreeSpaceExW(
+            ctypes.c_wchar_p(target), None, None, ctypes.pointer(free_bytes)
+        )
+        if ok:
+            return free_bytes.value
+    except Exception:
+        pass
+
+    return None
+
+
+def _existing_parent(path):
+    # type: (str) -> str
+    """存在する最も近い親ディレクトリを返す"""
+    current = os.path.abspath(path)
+    while not os.path.exists(current):
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+    return current
+
+
+def format_bytes(num_bytes):
+    # type: (int) -> str
+    """
+    バイト数を読みやすい形式に整形
+
+    Args:
+        num_bytes (int): バイト数
+
+    Returns:
+        str: 整形された文字列 (例: "1.5 GB")
+    """
+    value = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024.0:
+            return "{:.1f} {}".format(value, unit)
+        value /= 1024.0
+    return "{:.1f} TB".format(value)
+
+
+def read_json(path, default=None):
+    # type: (str, object) -> object
+    """
+    JSON ファイルを読み込む
+
+    Args:
+        path (str): ファイルパス
+        default (object): ファイルが存在しない・読めない場合の戻り値
+
+    Returns:
+        object: 読み込んだデータ
+    """
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path, data):
+    # type: (str, object) -> None
+    """
+    JSON ファイルを一時ファイル経由で書き込む
+
+    書き込み途中の不完全なファイルを他のプロセスが読まないようにする
+
+    Args:
+        path (str): ファイルパス
+        data (object): 書き込むデータ
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+    replace_file(temp_path, path)
+
+
+def replace_file(src, dst):
+    # type: (str, str) -> None
+    """
+    src を dst に置き換える
+
+    Python 2.7 には os.replace がなく、Windows の os.rename は
+    既存ファイルを上書きできないため、その場合は削除してから移動する
+    """
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
@@ -4,21 +4,48 @@
 
 Python logging ライブラリを使用
 コンソール、ファイル、メール用バッファの3出力先に対応
+コンソールとファイルへの出力はキュー経由で別スレッドが行い、
+ファイルはサイズでローテーションして古いものを gzip 圧縮する
 """
 
 import sys
 import os
+import re
+import gzip
+import shutil
+import atexit
+import threading
 from datetime import datetime
 
 try:
     # IronPython環境では一部のモジュールが制限される可能性があるため try-except で対応
     import logging
-    from logging.handlers import MemoryHandler
+    from logging.handlers import MemoryHandler, RotatingFileHandler
 except ImportError as e:
     print("Error importing logging modules: {}".format(str(e)))
     raise
 
-from config import LOG_CONFIG
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # Python 2.7 (IronPython) には QueueHandler / QueueListener がないため最小限の実装を使う
+    QueueHandler = None
+    QueueListener = None
+
+from config import LOG_CONFIG, DISTRIBUTED_CONFIG
+from work_queue import get_node_label
+
+
+# 起動中のキューリスナー（shutdown_logger で停止する）
+_listener = None
+
+# ログファイル名の {prefix}_ に続くタイムスタンプ部分
+_LOG_TIMESTAMP = re.compile(r"^\d{8}_\d{6}$")
 
 
 class EmailLogHandler(logging.Handler):
@@ -53,16 +80,178 @@ class EmailLogHandler(logging.Handler):
         self.log_buffer = []
 
 
+class _SimpleQueueHandler(logging.Handler):
+    """
+    QueueHandler の代替（Python 2.7 用）
+
+    ログレコードを整形済みの状態にしてキューに積むだけで、I/O は行わない
+    """
+    def __init__(self, record_queue):
+        # type: (queue.Queue) -> None
+        super(_SimpleQueueHandler, self).__init__()
+        self.queue = record_queue
+
+    def emit(self, record):
+        # type: (logging.LogRecord) -> None
+        """ログレコードをキューに追加"""
+        try:
+            # 別スレッドで整形できるよう引数と例外情報をメッセージに埋め込む
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class _SimpleQueueListener(object):
+    """
+    QueueListener の代替（Python 2.7 用）
+
+    キューからログレコードを取り出し、別スレッドで各ハンドラに渡す
+    """
+    _sentinel = None
+
+    def __init__(self, record_queue, *handlers):
+        # type: (queue.Queue, *logging.Handler) -> None
+        self.queue = record_queue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        # type: () -> None
+        """リスナースレッドを開始"""
+        self._thread = threading.Thread(target=self._monitor, name="log-listener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # type: () -> None
+        """キューに残ったレコードを全て処理してからスレッドを停止"""
+        if self._thread is not None:
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+    def _monitor(self):
+        # type: () -> None
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """
+    サイズでローテーションし、古いファイルを gzip 圧縮するファイルハンドラ
+
+    ローテーション後のファイル名は {ログファイル名}.1.gz, .2.gz, ... となり、
+    backupCount を超えた古いものは削除する
+    """
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding=None, compress=True):
+        # type: (str, int, int, str, bool) -> None
+        RotatingFileHandler.__init__(
+            self, filename, mode="a", maxBytes=maxBytes,
+            backupCount=backupCount, encoding=encoding
+        )
+        self.compress = compress
+
+    def doRollover(self):
+        # type: () -> None
+        """現在のファイルを閉じて圧縮し、新しいファイルを開く"""
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        suffix = ".gz" if self.compress else ""
+        if self.backupCount > 0:
+            for i in range(self.backupCount - 1, 0, -1):
+                src = "{}.{}{}".format(self.baseFilename, i, suffix)
+                dst = "{}.{}{}".format(self.baseFilename, i + 1, suffix)
+                if os.path.exists(src):
+                    if os.path.exists(dst):
+                        os.remove(dst)
+                    os.rename(src, dst)
+
+            dst = "{}.1{}".format(self.baseFilename, suffix)
+            if os.path.exists(dst):
+                os.remove(dst)
+            if self.compress:
+                _gzip_file(self.baseFilename, dst)
+                os.remove(self.baseFilename)
+            else:
+                os.rename(self.baseFilename, dst)
+        elif os.path.exists(self.baseFilename):
+            os.remove(self.baseFilename)
+
+        self.stream = self._open()
+
+
+def _gzip_file(src, dst):
+    # type: (str, str) -> None
+    """ファイルを gzip 圧縮して保存"""
+    with open(src, "rb") as f_in:
+        f_out = gzip.open(dst, "wb")
+        try:
+            shutil.copyfileobj(f_in, f_out)
+        finally:
+            f_out.close()
+
+
+def _purge_old_logs(log_dir, prefix, keep):
+    # type: (str, str, int) -> list
+    """
+    古い実行のログファイルを削除
+
+    {prefix}_YYYYMMDD_HHMMSS.log とそのローテーション済みファイルを1回分の実行として扱い、
+    新しいものから keep 回分を残す
+    {prefix}_{ノード名}_YYYYMMDD_HHMMSS.log のような他のノードのログは対象外
+
+    Returns:
+        list: 削除したファイルのパス
+    """
+    runs = {}
+    for filename in os.listdir(log_dir):
+        if not filename.startswith(prefix + "_") or ".log" not in filename:
+            continue
+        run_name = filename[:filename.index(".log")]
+        if not _LOG_TIMESTAMP.match(run_name[len(prefix) + 1:]):
+            continue
+        runs.setdefault(run_name, []).append(filename)
+
+    removed = []
+    for run_name in sorted(runs, reverse=True)[keep:]:
+        for filename in runs[run_name]:
+            path = os.path.join(log_dir, filename)
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError:
+                pass
+    return removed
+
+
 def setup_logger():
     # type: () -> tuple
     """
     ロガーのセットアップ
 
+    コンソール・ファイルへの出力はキューリスナーのスレッドで行う
+    終了前に shutdown_logger() を呼んでキューを出力し切ること
+
     Returns:
         tuple: (logger, email_handler)
             logger (logging.Logger): 設定済みのロガーインスタンス
             email_handler (EmailLogHandler): メール用ログハンドラ（ログ取得用）
     """
+    global _listener
+
+    # 前回のリスナーが残っていれば停止
+    shutdown_logger()
+
     # ロガーの作成
     logger = logging.getLogger("AnsysBatchRunner")
 
@@ -80,11 +269,15 @@ def setup_logger():
         datefmt="%Y-%m-%d %H:%M:%S"
     )
 
+    # キューリスナーが出力するハンドラ
+    output_handlers = []
+    startup_messages = []
+
     # 1. コンソールハンドラ
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    output_handlers.append(console_handler)
 
     # 2. ファイルハンドラ
     if LOG_CONFIG.get("log_to_file", False):
@@ -95,19 +288,49 @@ def setup_logger():
                 os.makedirs(log_dir)
 
             # タイムスタンプ付きログファイル名
+            # 分散実行ではログディレクトリを共有しても他のノードのログを消さないよう、ノード名を付ける
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             prefix = LOG_CONFIG.get("log_file_prefix", "ansys_batch")
+            if DISTRIBUTED_CONFIG.get("enabled", False):
+                prefix = "{}_{}".format(prefix, get_node_label())
             log_filename = "{}_{}.log".format(prefix, timestamp)
             log_filepath = os.path.join(log_dir, log_filename)
 
-            file_handler = logging.FileHandler(log_filepath, encoding="utf-8")
+            # 保持数を超えた過去の実行のログを削除
+            max_log_files = LOG_CONFIG.get("max_log_files", 0)
+            if max_log_files > 0:
+                removed = _purge_old_logs(log_dir, prefix, max_log_files - 1)
+                if removed:
+                    startup_messages.append(
+                        "Removed {} old log file(s) from {}".format(len(removed), log_dir)
+                    )
+
+            file_handler = CompressedRotatingFileHandler(
+                log_filepath,
+                maxBytes=LOG_CONFIG.get("max_bytes", 0),
+                backupCount=LOG_CONFIG.get("backup_count", 0),
+                encoding="utf-8",
+                compress=LOG_CONFIG.get("compress_rotated", True),
+            )
             file_handler.setLevel(level)
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            output_handlers.append(file_handler)
 
-            logger.info("Log file created: {}".format(log_filepath))
+            startup_messages.append("Log file created: {}".format(log_filepath))
         except Exception as e:
-            logger.warning("Failed to create file handler: {}".format(str(e)))
+            startup_messages.append("Failed to create file handler: {}".format(str(e)))
+
+    # コンソール・ファイルへの出力はキュー経由で別スレッドが行う
+    record_queue = queue.Queue(-1)
+    if QueueHandler is not None:
+        queue_handler = QueueHandler(record_queue)
+        _listener = QueueListener(record_queue, *output_handlers, respect_handler_level=True)
+    else:
+        queue_handler = _SimpleQueueHandler(record_queue)
+        _listener = _SimpleQueueListener(record_queue, *output_handlers)
+    queue_handler.setLevel(level)
+    logger.addHandler(queue_handler)
+    _listener.start()
 
     # 3. メール用バッファハンドラ
     email_handler = EmailLogHandler()
@@ -115,4 +338,38 @@ def setup_logger():
     email_handler.setFormatter(formatter)
     logger.addHandler(email_handler)
 
+    for message in startup_messages:
+        if message.startswith("Failed"):
+            logger.warning(message)
+        else:
+            logger.info(message)
+
     return logger, email_handler
+
+
+def shutdown_logger():
+    # type: () -> None
+    """
+    キューに残ったログを全て出力してからリスナーを停止し、ハンドラを閉じる
+
+    sys.exit の前に呼ぶこと（atexit にも登録済み）
+    """
+    global _listener
+
+    if _listener is None:
+        return
+
+    listener = _listener
+    _listener = None
+    try:
+        listener.stop()
+    finally:
+        for handler in listener.handlers:
+            try:
+                handler.flush()
+                handler.close()
+            except Exception:
+                pass
+
+
+atexit.register(shutdown_logger)
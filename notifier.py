@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+通知ポリシー
+
+send_email / send_project_start_email の上に載せる送信制御
+プロジェクトごとの通知をダイジェストにまとめ、失敗は即時送信する
+1回の実行あたりの送信通数・送信バイト数の上限を管理する
+"""
+
+import logging
+from datetime import datetime
+
+from config import EMAIL_CONFIG, NOTIFY_CONFIG
+from email_utils import (
+    send_email, send_project_start_email, create_project_start_subject,
+    format_digest_summary, create_digest_subject
+)
+
+
+class NotificationPolicy(object):
+    """
+    メール通知の送信ポリシー
+
+    mode が "immediate" の場合は従来通りイベントごとに送信し、
+    "digest" の場合は成功イベントを時間または件数の区切りでまとめて送信する
+    どちらのモードでも送信通数・バイト数の上限を適用し、
+    全体完了通知のために1通分は必ず残しておく
+    失敗通知のために reserved_failure_messages 通を残し、ダイジェストや開始通知ではこの分を使わない
+    """
+    def __init__(self, email_handler, logger, total_projects):
+        # type: (EmailLogHandler, logging.Logger, int) -> None
+        self.email_handler = email_handler
+        self.logger = logger
+        self.total_projects = total_projects
+
+        self.mode = NOTIFY_CONFIG.get("mode", "immediate")
+        self.digest_interval_seconds = NOTIFY_CONFIG.get("digest_interval_minutes", 60) * 60
+        self.digest_max_events = NOTIFY_CONFIG.get("digest_max_events", 20)
+        self.max_messages = NOTIFY_CONFIG.get("max_messages", 0)
+        self.max_bytes = NOTIFY_CONFIG.get("max_bytes", 0)
+        self.reserved_failure_messages = NOTIFY_CONFIG.get("reserved_failure_messages", 0)
+
+        self.pending_events = []  # type: list
+        self.window_start = None  # type: datetime
+        self.progress = {"processed": 0, "successful": 0}
+
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.dropped_messages = 0
+        self.dropped_bytes = 0
+        self.dropped_events = 0
+        self.digests_sent = 0
+
+        # 前回送信時点のログ位置（ダイジェストには差分のログのみ載せる）
+        self._log_offset = 0
+
+    def project_started(self, project_number, project_name, start_time,
+                        overall_successful, overall_processed):
+        # type: (int, str, datetime, int, int) -> None
+        """プロジェクト開始イベント"""
+        self._update_progress(overall_successful, overall_processed)
+
+        if self.mode != "digest":
+            full_log = self.email_handler.get_logs()
+            size = _byte_size(full_log) + 2048
+            if not self._reserve(size):
+                return
+            send_project_start_email(
+                project_number=project_number,
+                total_projects=self.total_projects,
+                project_name=project_name,
+                start_time=start_time,
+                overall_successful=overall_successful,
+                overall_processed=overall_processed,
+                full_log=full_log,
+                logger=self.logger
+            )
+            return
+
+        subject = create_project_start_subject(project_number, self.total_projects, project_name)
+        self._add_event(subject)
+
+    def project_finished(self, subject, summary, success, overall_successful, overall_processed):
+        # type: (str, str, bool, int, int) -> None
+        """プロジェクト完了イベント。失敗はダイジェストを待たずに送信"""
+        self._update_progress(overall_successful, overall_processed)
+
+        if self.mode != "digest":
+            self._send(subject, summary, self.email_handler.get_logs(), failure=not success)
+            return
+
+        if not success and NOTIFY_CONFIG.get("send_failures_immediately", True):
+            self._send(subject, summary, self._get_new_logs(), failure=True)
+            return
+
+        self._add_event(subject)
+
+    def send_immediate(self, subject, summary):
+        # type: (str, str) -> bool
+        """ダイジェストを待たずに送信（事前チェック結果など）"""
+        return self._send(subject, summary, self._get_new_logs())
+
+    def flush(self):
+        # type: () -> None
+        """溜まっているダイジェストを送信"""
+        if not self.pending_events:
+            return
+
+        events = self.pending_events
+        self.pending_events = []
+        self.window_start = None
+
+        summary = format_digest_summary(
+            events, self.total_projects,
+            self.progress["successful"], self.progress["processed"]
+        )
+        subject = create_digest_subject(
+            len(events), self.total_projects, self.progress["processed"]
+        )
+        full_log = self._get_new_logs()
+        size = _byte_size(subject) + _byte_size(summary) + _byte_size(full_log)
+        if not self._reserve(size):
+            self.dropped_events += len(events)
+            return
+        self.digests_sent += 1
+        self._log_offset = len(self.email_handler.log_buffer)
+        send_email(subject, summary, full_log, self.logger)
+
+    def send_final(self, subject, summary):
+        # type: (str, str) -> bool
+        """全体完了通知を送信。予算を超えていても送信する"""
+        full_log = self.email_handler.get_logs()
+        self.sent_messages += 1
+        self.sent_bytes += _byte_size(subject) + _byte_size(summary) + _byte_size(full_log)
+        return send_email(subject, summary, full_log, self.logger)
+
+    def format_section(self):
+        # type: () -> str
+        """全体完了通知に載せる通知の統計"""
+        lines = []
+        lines.append("メール通知:")
+        lines.append("  送信: {} 通 ({} KB)".format(
+            self.sent_messages, self.sent_bytes // 1024
+        ))
+        if self.mode == "digest":
+            lines.append("  ダイジェスト: {} 通".format(self.digests_sent))
+        if self.dropped_messages:
+            lines.append("  上限超過で未送信: {} 通 ({} KB)".format(
+                self.dropped_messages, self.dropped_bytes // 1024
+            ))
+        if self.dropped_events:
+            lines.append("  未送信のイベント: {} 件".format(self.dropped_events))
+        return "\n".join(lines)
+
+    def _update_progress(self, overall_successful, overall_processed):
+        # type: (int, int) -> None
+        self.progress["successful"] = overall_successful
+        self.progress["processed"] = overall_processed
+
+    def _add_event(self, text):
+        # type: (str) -> None
+        """ダイジェストにイベントを追加し、区切りに達していれば送信"""
+        now = datetime.now()
+        if self.window_start is None:
+            self.window_start = now
+        self.pending_events.append((now, text))
+
+        elapsed = (now - self.window_start).total_seconds()
+        if (len(self.pending_events) >= self.digest_max_events
+                or elapsed >= self.digest_interval_seconds):
+            self.flush()
+
+    def _get_new_logs(self):
+        # type: () -> str
+        """前回の送信以降に追加されたログ"""
+        return "\n".join(self.email_handler.log_buffer[self._log_offset:])
+
+    def _send(self, subject, summary, full_log, failure=False):
+        # type: (str, str, str, bool) -> bool
+        """予算の範囲内であれば送信。failure が True の場合は失敗通知用に残した分も使う"""
+        size = _byte_size(subject) + _byte_size(summary) + _byte_size(full_log)
+        if not self._reserve(size, failure):
+            return False
+        self._log_offset = len(self.email_handler.log_buffer)
+        return send_email(subject, summary, full_log, self.logger)
+
+    def _reserve(self, size, failure=False):
+        # type: (int, bool) -> bool
+        """
+        送信予算を確保
+
+        全体完了通知のために1通分を残す
+        失敗通知以外は、さらに失敗通知のために reserved_failure_messages 通を残す
+        """
+        if not EMAIL_CONFIG.get("enabled", False):
+            # 無効時は send_email 側でログを出すだけなので予算は消費しない
+            return True
+        reserved = 1
+        if not failure:
+            reserved += self.reserved_failure_messages
+        if self.max_messages and self.sent_messages + reserved >= self.max_messages:
+            return self._drop(size, "message budget")
+        if self.max_bytes and self.sent_bytes + size > self.max_bytes:
+            return self._drop(size, "byte budget")
+
+        self.sent_messages += 1
+        self.sent_bytes += size
+        return True
+
+    def _drop(self, size, reason):
+        # type: (int, str) -> bool
+        self.dropped_messages += 1
+        self.dropped_bytes += size
+        self.logger.warning("Notification dropped: {} exhausted ({} sent, {} KB)".format(
+            reason, self.sent_messages, self.sent_bytes // 1024
+        ))
+        return False
+
+
+def _byte_size(text):
+    # type: (str) -> int
+    """UTF-8 でのバイト数（Python 2 の str はそのまま長さを返す）"""
+    if isinstance(text, bytes):
+        return len(text)
+    return len(text.encode("utf-8"))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+事前チェック（プリフライト）
+
+ソルバーを動かす前に全プロジェクトをまとめて検査する
+ファイルの存在・読み取り権限・ディスク空き容量・SMTP 接続を並列に確認し、
+実行できないプロジェクトを除外、注意が必要なプロジェクトを後回しにする
+"""
+
+import os
+import socket
+import logging
+from datetime import datetime
+
+from config import LOG_CONFIG, EMAIL_CONFIG, PREFLIGHT_CONFIG
+from dp_selection import get_project_path, get_manifest_spec, load_manifest
+from fs_utils import get_free_bytes, format_bytes
+from workers import WorkerPool
+
+
+def run_preflight(projects, logger, backup_path_func):
+    # type: (list, logging.Logger, callable) -> dict
+    """
+    全プロジェクトの事前チェックを実行
+
+    Args:
+        projects (list): PROJECTS のエントリ（パスまたはマニフェスト付きの辞書）のリスト
+        logger (logging.Logger): ロガーインスタンス
+        backup_path_func (callable): プロジェクトパスからバックアップパスを生成する関数
+
+    Returns:
+        dict: チェック結果
+            {
+                "runnable": list,      # 実行順に並べた PROJECTS のエントリ
+                "dropped": list,       # [{"project": str, "errors": list}]
+                "deferred": list,      # [{"project": str, "warnings": list}]
+                "batch_issues": list,  # バッチ全体に関わる問題 (str)
+                "elapsed": timedelta,
+            }
+    """
+    start_time = datetime.now()
+    min_free_bytes = int(PREFLIGHT_CONFIG.get("min_free_space_mb", 0)) * 1024 * 1024
+
+    logger.info("Running preflight checks for {} project(s)...".format(len(projects)))
+
+    pool = WorkerPool(PREFLIGHT_CONFIG.get("max_workers", 8), name="preflight")
+    try:
+        batch_tasks = [pool.submit(_check_log_dir, min_free_bytes)]
+        if EMAIL_CONFIG.get("enabled", False) and PREFLIGHT_CONFIG.get("check_smtp", True):
+            batch_tasks.append(pool.submit(_check_smtp))
+
+        project_tasks = []
+        seen = set()
+        duplicates = []
+        for entry in projects:
+            project_path = get_project_path(entry)
+            key = os.path.normcase(os.path.abspath(project_path))
+            if key in seen:
+                duplicates.append(project_path)
+                continue
+            seen.add(key)
+            project_tasks.append(pool.submit(
+                _check_project, entry, backup_path_func, min_free_bytes
+            ))
+
+        batch_issues = []
+        for task in batch_tasks:
+            batch_issues.extend(task.result())
+        project_checks = [task.result() for task in project_tasks]
+    finally:
+        pool.shutdown(wait=False)
+
+    runnable = []
+    deferred = []
+    dropped = []
+    for check in project_checks:
+        if check["errors"]:
+            dropped.append({"project": check["project"], "errors": check["errors"]})
+        elif check["warnings"]:
+            deferred.append({"project": check["project"], "warnings": check["warnings"]})
+        else:
+            runnable.append(check["entry"])
+
+    # 重複したエントリは2回目以降を無視する（失敗したプロジェクトとしては数えない）
+    for project_path in duplicates:
+        batch_issues.append("Duplicate entry in PROJECTS ignored: {}".format(project_path))
+
+    # 警告のあるプロジェクトは問題のないプロジェクトの後に実行する
+    entries = dict((check["project"], check["entry"]) for check in project_checks)
+    runnable.extend(entries[entry["project"]] for entry in deferred)
+
+    report = {
+        "runnable": runnable,
+        "dropped": dropped,
+        "deferred": deferred,
+        "batch_issues": batch_issues,
+        "elapsed": datetime.now() - start_time,
+    }
+
+    for issue in batch_issues:
+        logger.warning("Preflight: {}".format(issue))
+    for entry in deferred:
+        for warning in entry["warnings"]:
+            logger.warning("Preflight: {} deferred: {}".format(entry["project"], warning))
+    for entry in dropped:
+        for error in entry["errors"]:
+            logger.error("Preflight: {} dropped: {}".format(entry["project"], error))
+
+    logger.info("Preflight completed: {} runnable, {} deferred, {} dropped".format(
+        len(runnable), len(deferred), len(dropped)
+    ))
+
+    return report
+
+
+def has_preflight_issues(report):
+    # type: (dict) -> bool
+    """事前チェックで何らかの問題が見つかったか"""
+    return bool(report["dropped"] or report["deferred"] or report["batch_issues"])
+
+
+def _check_project(entry, backup_path_func, min_free_bytes):
+    # type: (object, callable, int) -> dict
+    """
+    1つのプロジェクトを検査
+
+    errors はプロジェクトを除外する問題、warnings は後回しにする問題
+    """
+    project_path = get_project_path(entry)
+    check = {"project": project_path, "entry": entry, "errors": [], "warnings": []}
+
+    try:
+        if not os.path.isfile(project_path):
+            check["errors"].append("Project file not found")
+            return check
+
+        if not os.access(project_path, os.R_OK):
+            check["errors"].append("Project file is not readable")
+            return check
+
+        # 設計ポイント選択のマニフェスト
+        try:
+            load_manifest(get_manifest_spec(entry), project_path)
+        except ValueError as e:
+            check["errors"].append(str(e))
+            return check
+
+        # 保存失敗時のバックアップ先の空き容量
+        backup_dir = os.path.dirname(backup_path_func(project_path))
+        free_bytes = get_free_bytes(backup_dir)
+        if free_bytes is not None and free_bytes < min_free_bytes:
+            check["warnings"].append(
+                "Low free space in backup directory {}: {}".format(
+                    backup_dir, format_bytes(free_bytes)
+                )
+            )
+    except Exception as e:
+        check["errors"].append("Preflight check failed: {}".format(str(e)))
+
+    return check
+
+
+def _check_log_dir(min_free_bytes):
+    # type: (int) -> list
+    """ログディレクトリの空き容量を検査"""
+    if not LOG_CONFIG.get("log_to_file", False):
+        return []
+
+    log_dir = LOG_CONFIG.get("log_dir", ".")
+    try:
+        free_bytes = get_free_bytes(log_dir)
+    except Exception as e:
+        return ["Failed to check log directory {}: {}".format(log_dir, str(e))]
+
+    if free_bytes is not None and free_bytes < min_free_bytes:
+        return ["Low free space in log directory {}: {}".format(
+            log_dir, format_bytes(free_bytes)
+        )]
+    return []
+
+
+def _check_smtp():
+    # type: () -> list
+    """SMTP サーバーへ TCP 接続できるか検査"""
+    smtp_server = EMAIL_CONFIG["smtp_server"]
+    smtp_port = EMAIL_CONFIG["smtp_port"]
+    timeout = PREFLIGHT_CONFIG.get("smtp_timeout", 10)
+    try:
+        sock = socket.create_connection((smtp_server, smtp_port), timeout)
+        sock.close()
+    except Exception as e:
+        return ["SMTP server {}:{} is not reachable: {}".format(
+            smtp_server, smtp_port, str(e)
+        )]
+    return []
+
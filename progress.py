@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+進捗の公開
+
+実行中のプロジェクト・設計ポイント・完了数・フェーズごとの所要時間・残り時間の見込みを
+JSON ファイル（定期的に上書き）とローカルの HTTP エンドポイント（Prometheus 形式）で公開する
+処理ループからの更新はメモリ上の値を書き換えるだけで、I/O は別スレッドが行う
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from config import LOG_CONFIG, PROGRESS_CONFIG
+from fs_utils import write_json_atomic
+from work_queue import node_file_path
+
+
+# 計測するフェーズ
+PHASES = ("open", "dp", "save")
+
+
+class ProgressReporter(object):
+    """
+    バッチの進捗状態
+
+    更新メソッドはロックを取って値を書き換えるだけ（定数時間）
+    ステータスファイルの書き込みと HTTP の応答は別スレッドで行う
+    """
+    def __init__(self, total_projects, logger):
+        # type: (int, logging.Logger) -> None
+        """
+        Args:
+            total_projects (int): このノードで処理するプロジェクト数
+                分散実行では他のノードとキューを分け合うため None（残り時間は実行中のプロジェクトのみ）
+            logger (logging.Logger): ロガーインスタンス
+        """
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._writer = None
+        self._server = None
+
+        self.started = time.time()
+        self.state = "running"
+        self.total_projects = total_projects
+        self.projects_completed = 0
+        self.projects_failed = 0
+        self.project_seconds_total = 0.0
+
+        self.current_project = None  # type: str
+        self.current_project_index = 0
+        self.current_project_started = None  # type: float
+        self.dp_index = 0
+        self.dp_total = 0
+        self.dps_completed = 0
+        self.dps_failed = 0
+
+        self.current_phase = None  # type: str
+        self._phase_started = None  # type: float
+        self._phase_weight = 1  # 現在のフェーズで同時に処理している数
+        self.phase_seconds = dict((phase, 0.0) for phase in PHASES)
+        self.phase_counts = dict((phase, 0) for phase in PHASES)
+
+        self.status_file = None
+        if PROGRESS_CONFIG.get("write_status_file", True):
+            self.status_file = node_file_path(PROGRESS_CONFIG.get("status_file") or os.path.join(
+                LOG_CONFIG.get("log_dir", "."), "status.json"
+            ))
+
+    # ------------------------------------------------------------
+    # 開始・終了
+    # ------------------------------------------------------------
+
+    def start(self):
+        # type: () -> None
+        """ステータスファイルの書き込みスレッドと HTTP サーバーを開始"""
+        if self.status_file:
+            self._writer = threading.Thread(target=self._write_loop, name="progress-writer")
+            self._writer.daemon = True
+            self._writer.start()
+            self.logger.info("Progress status file: {}".format(self.status_file))
+
+        if PROGRESS_CONFIG.get("http_enabled", False):
+            port = PROGRESS_CONFIG.get("http_port", 9108)
+            try:
+                self._server = HTTPServer(("127.0.0.1", port), _make_handler(self))
+                thread = threading.Thread(target=self._server.serve_forever, name="progress-http")
+                thread.daemon = True
+                thread.start()
+                self.logger.info("Progress endpoint: http://127.0.0.1:{}/metrics".format(port))
+            except Exception as e:
+                self._server = None
+                self.logger.warning("Failed to start progress endpoint: {}".format(str(e)))
+
+    def finish(self):
+        # type: () -> None
+        """最終状態を書き込み、スレッドと HTTP サーバーを停止"""
+        with self._lock:
+            self.state = "finished"
+            self.current_phase = None
+            self._stopped = True
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # ------------------------------------------------------------
+    # 更新（処理ループから呼ぶ）
+    # ------------------------------------------------------------
+
+    def set_state(self, state):
+        # type: (str) -> None
+        """実行状態 (running / paused) を設定"""
+        with self._lock:
+            self.state = state
+
+    def project_started(self, project_index, project_name):
+        # type: (int, str) -> None
+        """プロジェクトの処理開始"""
+        with self._lock:
+            self.current_project = project_name
+            self.current_project_index = project_index
+            self.current_project_started = time.time()
+            self.dp_index = 0
+            self.dp_total = 0
+
+    def project_finished(self, success):
+        # type: (bool) -> None
+        """プロジェクトの処理完了"""
+        with self._lock:
+            self._end_phase(time.time())
+            self.projects_completed += 1
+            if not success:
+                self.projects_failed += 1
+            if self.current_project_started is not None:
+                self.project_seconds_total += time.time() - self.current_project_started
+            self.current_project = None
+            self.current_project_started = None
+
+    def phase_started(self, phase):
+        # type: (str) -> None
+        """フェーズ (open / save) の開始"""
+        with self._lock:
+            now = time.time()
+            self._end_phase(now)
+            self.current_phase = phase
+            self._phase_started = now
+
+    def phase_finished(self):
+        # type: () -> None
+        """現在のフェーズの終了"""
+        with self._lock:
+            self._end_phase(time.time())
+
+    def set_dp_total(self, dp_total):
+        # type: (int) -> None
+        """現在のプロジェクトの設計ポイント数"""
+        with self._lock:
+            self.dp_total = dp_total
+
+    def dp_started(self, dp_index, count=1):
+        # type: (int, int) -> None
+        """
+        設計ポイントの処理開始
+
+        Args:
+            dp_index (int): 処理中の設計ポイントの処理順（まとめて更新する場合は最後のもの）
+            count (int): まとめて更新する設計ポイント数
+                所要時間の平均は設計ポイント1つあたりで集計する
+        """
+        with self._lock:
+            now = time.time()
+            self._end_phase(now)
+            self.dp_index = dp_index
+            self.current_phase = "dp"
+            self._phase_started = now
+            self._phase_weight = max(1, count)
+
+    def dp_finished(self, success, skipped=False):
+        # type: (bool, bool) -> None
+        """設計ポイントの処理完了。更新済みでスキップしたものは所要時間に含めない"""
+        with self._lock:
+            if skipped:
+                self.current_phase = None
+                self._phase_started = None
+            else:
+                self._end_phase(time.time())
+            self.dps_completed += 1
+            if not success:
+                self.dps_failed += 1
+
+    def _end_phase(self, now):
+        # type: (float) -> None
+        """現在のフェーズの所要時間を集計（ロック内で呼ぶ）"""
+        if self.current_phase is not None and self._phase_started is not None:
+            self.phase_seconds[self.current_phase] += now - self._phase_started
+            self.phase_counts[self.current_phase] += self._phase_weight
+        self.current_phase = None
+        self._phase_started = None
+        self._phase_weight = 1
+
+    # ------------------------------------------------------------
+    # 出力
+    # ------------------------------------------------------------
+
+    def snapshot(self):
+        # type: () -> dict
+        """現在の状態を JSON にできる辞書で返す"""
+        with self._lock:
+            now = time.time()
+            phases = {}
+            for phase in PHASES:
+                seconds = self.phase_seconds[phase]
+                count = self.phase_counts[phase]
+                phases[phase] = {
+                    "seconds_total": round(seconds, 3),
+                    "count": count,
+                    "seconds_avg": round(seconds / count, 3) if count else None,
+                }
+            eta = self._estimate_remaining()
+            return {
+                "state": self.state,
+                "started": _format_time(self.started),
+                "updated": _format_time(now),
+                "elapsed_seconds": round(now - self.started, 3),
+                "current_project": {
+                    "name": self.current_project,
+                    "index": self.current_project_index,
+                    "phase": self.current_phase,
+                    "dp_index": self.dp_index,
+                    "dp_total": self.dp_total,
+                },
+                "projects": {
+                    "total": self.total_projects,
+                    "completed": self.projects_completed,
+                    "succeeded": self.projects_completed - self.projects_failed,
+                    "failed": self.projects_failed,
+                },
+                "design_points": {
+                    "completed": self.dps_completed,
+                    "failed": self.dps_failed,
+                },
+                "phases": phases,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "eta": _format_time(now + eta) if eta is not None else None,
+            }
+
+    def _estimate_remaining(self):
+        # type: () -> float
+        """残り時間の見込み（秒）。見積もれない場合は None（ロック内で呼ぶ）"""
+        if self.state == "finished":
+            return 0.0
+
+        dp_count = self.phase_counts["dp"]
+        avg_dp = self.phase_seconds["dp"] / dp_count if dp_count else None
+        save_count = self.phase_counts["save"]
+        avg_save = self.phase_seconds["save"] / save_count if save_count else 0.0
+
+        # 実行中のプロジェクトの残り
+        current = 0.0
+        if self.current_project is not None:
+            if avg_dp is None:
+                return None
+            remaining_dps = max(0, self.dp_total - self.dp_index)
+            current = remaining_dps * avg_dp + avg_save
+
+        # 未着手のプロジェクト（分散実行では他のノードも取り出すため、実行中のプロジェクトのみ）
+        if self.total_projects is None:
+            return current
+        remaining_projects = self.total_projects - self.projects_completed
+        if self.current_project is not None:
+            remaining_projects -= 1
+        if remaining_projects <= 0:
+            return current
+        if self.projects_completed:
+            return current + remaining_projects * (
+                self.project_seconds_total / self.projects_completed
+            )
+        if self.current_project_started is not None and avg_dp is not None:
+            elapsed = time.time() - self.current_project_started
+            return current + remaining_projects * (elapsed + current)
+        return None
+
+    def format_metrics(self):
+        # type: () -> str
+        """Prometheus のテキスト形式で出力"""
+        status = self.snapshot()
+        lines = []
+
+        def metric(name, value, help_text, metric_type="gauge", labels=None):
+            if value is None:
+                return
+            if help_text:
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+            label_text = ""
+            if labels:
+                label_text = "{" + ",".join(
+                    '{}="{}"'.format(key, _escape_label(val)) for key, val in labels
+                ) + "}"
+            lines.append("{}{} {}".format(name, label_text, value))
+
+        metric("ansys_batch_running", 1 if status["state"] == "running" else 0,
+               "1 while the batch is running")
+        metric("ansys_batch_paused", 1 if status["state"] == "paused" else 0,
+               "1 while waiting for the next run window")
+        metric("ansys_batch_elapsed_seconds", status["elapsed_seconds"],
+               "Seconds since the batch started")
+        metric("ansys_batch_projects_total", status["projects"]["total"],
+               "Projects scheduled in this batch")
+        metric("ansys_batch_projects_completed", status["projects"]["completed"],
+               "Projects finished so far")
+        metric("ansys_batch_projects_failed", status["projects"]["failed"],
+               "Projects finished with errors")
+        metric("ansys_batch_design_points_completed", status["design_points"]["completed"],
+               "Design points processed so far")
+        metric("ansys_batch_design_points_failed", status["design_points"]["failed"],
+               "Design points that failed to update")
+
+        current = status["current_project"]
+        metric("ansys_batch_current_project_index", current["index"],
+               "1-based index of the project being processed")
+        metric("ansys_batch_current_dp_index", current["dp_index"],
+               "1-based index of the design point being processed")
+        metric("ansys_batch_current_dp_total", current["dp_total"],
+               "Design points in the current project")
+        if current["name"]:
+            metric("ansys_batch_current_project_info", 1, "Project being processed",
+                   labels=[("project", current["name"]), ("phase", current["phase"] or "")])
+
+        first = True
+        for phase in PHASES:
+            metric("ansys_batch_phase_seconds_total", status["phases"][phase]["seconds_total"],
+                   "Seconds spent per phase" if first else None, "counter",
+                   labels=[("phase", phase)])
+            first = False
+        first = True
+        for phase in PHASES:
+            metric("ansys_batch_phase_count", status["phases"][phase]["count"],
+                   "Completed phase executions" if first else None, "counter",
+                   labels=[("phase", phase)])
+            first = False
+
+        metric("ansys_batch_eta_seconds", status["eta_seconds"],
+               "Estimated seconds until the batch finishes")
+
+        return "\n".join(lines) + "\n"
+
+    def _write_loop(self):
+        # type: () -> None
+        """ステータスファイルを一定間隔で書き込む。finish() 後に最終状態を書いて終了"""
+        interval = PROGRESS_CONFIG.get("write_interval_seconds", 5)
+        while True:
+            with self._lock:
+                stopped = self._stopped
+            try:
+                write_json_atomic(self.status_file, self.snapshot())
+            except Exception as e:
+                self.logger.warning("Failed to write progress status: {}".format(str(e)))
+            if stopped:
+                break
+            self._wakeup.wait(interval)
+
+
+def _make_handler(reporter):
+    # type: (ProgressReporter) -> type
+    """reporter を参照する HTTP リクエストハンドラのクラスを作成"""
+    class _ProgressHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body = reporter.format_metrics()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif self.path.startswith("/status"):
+                body = json.dumps(reporter.snapshot(), indent=2, sort_keys=True)
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = _to_bytes(body)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # アクセスログは出力しない
+            pass
+
+    return _ProgressHandler
+
+
+def _format_time(timestamp):
+    # type: (float) -> str
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _escape_label(value):
+    # type: (str) -> str
+    """Prometheus のラベル値をエスケープ"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _to_bytes(text):
+    # type: (str) -> bytes
+    if isinstance(text, bytes):
+        return text
+    return text.encode("utf-8")
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+ソルバーファイルの整理
+
+保持済み (Retained) の設計ポイントについて、{プロジェクト名}_files/dp{ID} 以下の
+中間ファイルをファイル種別ごとのルールに従って削除または移動する
+プロジェクトの肥大化を抑え、Open / Save にかかる時間を短縮する
+"""
+
+import os
+import shutil
+import fnmatch
+import logging
+from datetime import datetime
+
+from config import LOG_CONFIG, PRUNE_CONFIG
+from fs_utils import format_bytes, read_json, write_json_atomic
+from work_queue import node_file_path
+
+
+class SolverFilePruner(object):
+    """
+    1つのプロジェクトのソルバーファイル整理
+
+    prune_design_point() を設計ポイントの更新後に、または
+    prune_design_points() をプロジェクトの全設計ポイント処理後に呼ぶ
+    """
+    def __init__(self, project_path, logger):
+        # type: (str, logging.Logger) -> None
+        self.project_path = project_path
+        self.logger = logger
+
+        name = os.path.splitext(os.path.basename(project_path))[0]
+        self.project_name = name
+        self.files_dir = os.path.join(
+            os.path.dirname(os.path.abspath(project_path)), name + "_files"
+        )
+        self.rules = PRUNE_CONFIG.get("rules", [])
+        self.default_action = PRUNE_CONFIG.get("default_action", "keep")
+        self.move_dir = PRUNE_CONFIG.get("move_dir")
+
+        self.stats = {
+            "design_points": 0,
+            "deleted_files": 0,
+            "moved_files": 0,
+            "bytes_freed": 0,
+            "errors": 0,
+        }
+
+    def prune_design_point(self, dp):
+        # type: (object) -> int
+        """
+        1つの設計ポイントの中間ファイルを整理
+
+        現在の設計ポイント (dp0) と保持されていない設計ポイントは対象外
+
+        Args:
+            dp: Workbench の設計ポイントオブジェクト
+
+        Returns:
+            int: 解放したバイト数
+        """
+        try:
+            dp_name = str(dp.Name)
+            if dp_name == "0" or not dp.Retained:
+                return 0
+        except Exception as e:
+            self.logger.warning("Skipping pruning for design point: {}".format(str(e)))
+            return 0
+
+        dp_dir = os.path.join(self.files_dir, "dp" + dp_name)
+        if not os.path.isdir(dp_dir):
+            return 0
+
+        freed = 0
+        for dirpath, _, filenames in os.walk(dp_dir):
+            for filename in filenames:
+                action = self._get_action(filename)
+                if action == "keep":
+                    continue
+                freed += self._apply(os.path.join(dirpath, filename), action)
+
+        self.stats["design_points"] += 1
+        self.stats["bytes_freed"] += freed
+        if freed:
+            self.logger.info("Pruned design point {}: {} freed".format(
+                dp_name, format_bytes(freed)
+            ))
+        return freed
+
+    def prune_design_points(self, design_points):
+        # type: (list) -> int
+        """全設計ポイントの中間ファイルを整理し、解放したバイト数を返す"""
+        freed = 0
+        for dp in design_points:
+            freed += self.prune_design_point(dp)
+        return freed
+
+    def _get_action(self, filename):
+        # type: (str) -> str
+        """ファイル名に一致する最初のルールの処理 (keep / delete / move) を返す"""
+        name = filename.lower()
+        for pattern, action in self.rules:
+            if fnmatch.fnmatch(name, pattern.lower()):
+                return action
+        return self.default_action
+
+    def _apply(self, path, action):
+        # type: (str, str) -> int
+        """ファイルを削除または移動し、プロジェクトから減ったバイト数を返す"""
+        try:
+            size = os.path.getsize(path)
+            if action == "move" and self.move_dir:
+                relative = os.path.relpath(path, self.files_dir)
+                dst = os.path.join(self.move_dir, self.project_name, relative)
+                dst_dir = os.path.dirname(dst)
+                if not os.path.exists(dst_dir):
+                    os.makedirs(dst_dir)
+                shutil.move(path, dst)
+                self.stats["moved_files"] += 1
+            else:
+                os.remove(path)
+                self.stats["deleted_files"] += 1
+            return size
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.logger.warning("Failed to prune {}: {}".format(path, str(e)))
+            return 0
+
+
+def record_save_time(project_path, save_seconds, pruned):
+    # type: (str, float, bool) -> tuple
+    """
+    プロジェクトの保存時間を記録し、前回と整理前の保存時間を返す
+
+    整理の前後を比較できるよう、整理が無効の実行でも毎回記録する
+
+    Args:
+        project_path (str): プロジェクトファイルのパス
+        save_seconds (float): 今回の保存時間（秒）
+        pruned (bool): 今回の実行で中間ファイルを整理したか
+
+    Returns:
+        tuple: (previous, before_pruning)
+            previous (float): 前回の保存時間（秒）
+            before_pruning (float): 整理しなかった最後の実行の保存時間（秒）
+            いずれも記録がない場合は None
+    """
+    state_file = _get_state_file()
+    state = read_json(state_file, {})
+    key = os.path.normcase(os.path.abspath(project_path))
+
+    entry = state.get(key, {})
+    previous = entry.get("save_seconds")
+    before_pruning = entry.get("unpruned_save_seconds")
+    state[key] = {
+        "save_seconds": save_seconds,
+        "unpruned_save_seconds": before_pruning if pruned else save_seconds,
+        "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    try:
+        write_json_atomic(state_file, state)
+    except Exception:
+        pass
+    return previous, before_pruning
+
+
+def format_prune_section(project_results):
+    # type: (list) -> str
+    """全体完了通知に載せるソルバーファイル整理の統計"""
+    pruned = [r for r in project_results if r.get("prune")]
+
+    lines = []
+    lines.append("ソルバーファイル整理:")
+    lines.append("  解放: {}".format(
+        format_bytes(sum(r["prune"]["bytes_freed"] for r in pruned))
+    ))
+    for r in pruned:
+        stats = r["prune"]
+        line = "  {}: {} 解放 (削除 {} / 移動 {})".format(
+            r["project"], format_bytes(stats["bytes_freed"]),
+            stats["deleted_files"], stats["moved_files"]
+        )
+        if stats.get("save_seconds") is not None:
+            if stats.get("unpruned_save_seconds") is not None:
+                line += ", 保存時間 整理前 {:.1f} 秒".format(stats["unpruned_save_seconds"])
+                if stats.get("previous_save_seconds") is not None:
+                    line += " / 前回 {:.1f} 秒".format(stats["previous_save_seconds"])
+                line += " -> 今回 {:.1f} 秒".format(stats["save_seconds"])
+            elif stats.get("previous_save_seconds") is not None:
+                line += ", 保存時間 前回 {:.1f} 秒 -> 今回 {:.1f} 秒".format(
+                    stats["previous_save_seconds"], stats["save_seconds"]
+                )
+            else:
+                line += ", 保存時間 {:.1f} 秒".format(stats["save_seconds"])
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _get_state_file():
+    # type: () -> str
+    """保存時間の記録ファイルのパス（分散実行ではノードごと）"""
+    return node_file_path(PRUNE_CONFIG.get("state_file") or os.path.join(
+        LOG_CONFIG.get("log_dir", "."), "prune_state.json"
+    ))
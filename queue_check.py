@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+r"""
+分散実行の動作確認
+
+一時ディレクトリを共有フォルダの代わりにして、work_queue.WorkQueue を使うワーカープロセスを
+複数起動し、リース・期限切れ・全体完了通知の選出が想定通りに動くかを確認する
+Workbench は不要で、通常の Python で1台のマシン上で実行できる
+
+シナリオ:
+    basic:     3 ノードで全タスクが1回ずつ処理され、全体完了通知を送るノードが1つだけ選ばれる
+    crash:     リースを持ったまま異常終了したノードのタスクを、期限切れ後に他のノードが引き取る
+    heartbeat: リースの有効期間より長くかかるタスクも、ハートビートで延長されて引き取られない
+    attempts:  取り出したノードが毎回異常終了するタスクは max_attempts 回で失敗として扱う
+    rerun:     完了済みのキューに参加したノードはエラー終了する
+    stalled:   応答が止まってリースを失ったノードは結果を書き込まず、
+               同じタスクに失敗と成功の結果がある場合は成功の結果が集計される
+
+使用方法:
+    python queue_check.py
+    python queue_check.py --scenario crash attempts --keep
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+import subprocess
+
+from config import DISTRIBUTED_CONFIG
+from fs_utils import read_json, write_json_atomic
+from work_queue import WorkQueue
+
+
+SCENARIOS = ("basic", "crash", "heartbeat", "attempts", "rerun", "stalled")
+
+# ワーカーがリースを持ったまま異常終了したときの終了コード
+CRASH_EXIT_CODE = 3
+
+# 短い時間で期限切れまで確認できるリース設定
+_FAST_LEASE = ["--lease", "1.0", "--heartbeat", "0.2", "--poll", "0.2"]
+
+
+# ============================================================
+# ワーカー（子プロセス）
+# ============================================================
+
+def run_worker(args):
+    # type: (argparse.Namespace) -> int
+    """
+    1ノード分のワーカー
+
+    run_projects.main() と同じ順序でキューを使い、プロジェクトの処理の代わりに args.work 秒待つ
+    args.crash_on のタスクを取り出したら、リースを持ったまま異常終了する
+    args.stall_on のタスクを取り出したら、ハートビートを止めてリースの有効期間より長く待つ
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - {} - %(levelname)s - %(message)s".format(args.node)
+    )
+    logger = logging.getLogger("queue_check")
+
+    DISTRIBUTED_CONFIG.update({
+        "queue_dir": args.queue_dir,
+        "batch_id": None,
+        "run_tag": args.run_tag,
+        "node_name": args.node,
+        "lease_seconds": args.lease,
+        "heartbeat_seconds": args.heartbeat,
+        "poll_seconds": args.poll,
+        "max_attempts": args.max_attempts,
+    })
+    projects = _project_names(args.tasks)
+    queue = WorkQueue(logger, projects)
+
+    if queue.try_seed():
+        queue.seed(projects)
+    if not queue.wait_until_ready():
+        return 2
+
+    queue.start()
+    try:
+        for entry in queue:
+            if entry in args.crash_on:
+                logger.info("Simulating a crash while holding the lease for {}".format(entry))
+                os._exit(CRASH_EXIT_CODE)
+            if entry in args.stall_on:
+                logger.info("Simulating a stalled node for {}".format(entry))
+                queue.close()
+                time.sleep(args.lease * 3)
+            time.sleep(args.work)
+            if not queue.lease_held():
+                # run_projects ではこの時点でプロジェクトを保存せずに打ち切る
+                print("LOST {}".format(entry))
+            queue.complete({
+                "project": entry,
+                "success": True,
+                "error": None,
+                "dp_total": 0,
+                "dp_success": 0,
+                "path": entry,
+            })
+    finally:
+        queue.close()
+
+    if queue.elect_summary():
+        results = queue.collect_results()
+        print("SUMMARY {}".format(len(results)))
+    sys.stdout.flush()
+    return 0
+
+
+def _project_names(count):
+    # type: (int) -> list
+    return ["P{:02d}.wbpj".format(n) for n in range(1, count + 1)]
+
+
+# ============================================================
+# シナリオ（親プロセス）
+# ============================================================
+
+class _Cluster(object):
+    """1つのシナリオで起動するワーカープロセスの集まり"""
+    def __init__(self, work_dir, name, tasks):
+        # type: (str, str, int) -> None
+        self.queue_dir = os.path.join(work_dir, name)
+        self.log_dir = os.path.join(work_dir, name + "_logs")
+        os.makedirs(self.log_dir)
+        self.run_tag = name
+        self.tasks = tasks
+
+    def run(self, workers, timeout=60):
+        # type: (list, float) -> dict
+        """
+        ワーカーを起動して全て終了するまで待つ
+
+        Args:
+            workers (list): (ノード名, 起動を遅らせる秒数, 追加の引数) のリスト
+
+        Returns:
+            dict: {ノード名: (終了コード, 標準出力)}
+        """
+        processes = []
+        started = time.time()
+        for node, delay, extra in sorted(workers, key=lambda w: w[1]):
+            wait = started + delay - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            command = [
+                sys.executable, os.path.abspath(__file__), "--worker",
+                "--queue-dir", self.queue_dir, "--run-tag", self.run_tag,
+                "--node", node, "--tasks", str(self.tasks),
+            ] + list(extra)
+            log = open(os.path.join(self.log_dir, node + ".log"), "w")
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log,
+                                       universal_newlines=True)
+            processes.append((node, process, log))
+
+        outcome = {}
+        for node, process, log in processes:
+            remaining = max(1.0, timeout - (time.time() - started))
+            deadline = time.time() + remaining
+            while process.poll() is None and time.time() < deadline:
+                time.sleep(0.1)
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            outcome[node] = (process.returncode, process.stdout.read())
+            process.stdout.close()
+            log.close()
+        return outcome
+
+    @property
+    def root(self):
+        # type: () -> str
+        """キューのディレクトリ（{queue_dir}/{batch_id}）"""
+        roots = glob.glob(os.path.join(self.queue_dir, "*"))
+        return roots[0] if len(roots) == 1 else None
+
+    def results(self):
+        # type: () -> dict
+        """{タスク ID: [処理結果]}"""
+        results = {}
+        for path in glob.glob(os.path.join(self.root, "results", "*.json")):
+            result = read_json(path, None)
+            if result:
+                results.setdefault(result["task_id"], []).append(result)
+        return results
+
+    def expired(self, task_id):
+        # type: (str) -> int
+        """期限切れで回収されたリースの数"""
+        return len(glob.glob(os.path.join(self.root, "expired", task_id + ".*")))
+
+
+def _summaries(outcome):
+    # type: (dict) -> list
+    """全体完了通知を送るノードに選ばれたノードと結果数"""
+    summaries = []
+    for node, (_, output) in sorted(outcome.items()):
+        for line in output.splitlines():
+            if line.startswith("SUMMARY "):
+                summaries.append((node, int(line.split()[1])))
+    return summaries
+
+
+def _check(condition, message, errors):
+    # type: (bool, str, list) -> None
+    if not condition:
+        errors.append(message)
+
+
+def _check_each_task_once(cluster, errors):
+    # type: (_Cluster, list) -> dict
+    results = cluster.results()
+    for number in range(1, cluster.tasks + 1):
+        task_id = "{:04d}".format(number)
+        count = len(results.get(task_id, []))
+        _check(count == 1, "task {} has {} result(s)".format(task_id, count), errors)
+    return results
+
+
+def _check_single_summary(outcome, expected, errors):
+    # type: (dict, int, list) -> None
+    summaries = _summaries(outcome)
+    _check(len(summaries) == 1, "{} node(s) sent the summary".format(len(summaries)), errors)
+    if summaries:
+        _check(summaries[0][1] == expected, "summary has {} result(s), expected {}".format(
+            summaries[0][1], expected
+        ), errors)
+
+
+def scenario_basic(work_dir):
+    # type: (str) -> list
+    cluster = _Cluster(work_dir, "basic", tasks=6)
+    outcome = cluster.run([
+        ("A", 0.0, ["--work", "0.2"]),
+        ("B", 0.1, ["--work", "0.2"]),
+        ("C", 0.2, ["--work", "0.2"]),
+    ])
+    errors = []
+    for node, (code, _) in sorted(outcome.items()):
+        _check(code == 0, "node {} exited with {}".format(node, code), errors)
+    _check_each_task_once(cluster, errors)
+    _check_single_summary(outcome, 6, errors)
+    return errors
+
+
+def scenario_crash(work_dir):
+    # type: (str) -> list
+    cluster = _Cluster(work_dir, "crash", tasks=3)
+    outcome = cluster.run([
+        ("A", 0.0, ["--work", "0.1", "--crash-on", "P01.wbpj"] + _FAST_LEASE),
+        ("B", 0.3, ["--work", "0.1"] + _FAST_LEASE),
+    ])
+    errors = []
+    _check(outcome["A"][0] == CRASH_EXIT_CODE, "node A exited with {}".format(outcome["A"][0]),
+           errors)
+    _check(outcome["B"][0] == 0, "node B exited with {}".format(outcome["B"][0]), errors)
+    results = _check_each_task_once(cluster, errors)
+    reclaimed = results.get("0001", [{}])[0]
+    _check(reclaimed.get("node") == "B" and reclaimed.get("success"),
+           "task 0001 was not completed by node B", errors)
+    _check(cluster.expired("0001") == 1,
+           "task 0001 has {} expired lease(s)".format(cluster.expired("0001")), errors)
+    _check_single_summary(outcome, 3, errors)
+    return errors
+
+
+def scenario_heartbeat(work_dir):
+    # type: (str) -> list
+    cluster = _Cluster(work_dir, "heartbeat", tasks=3)
+    outcome = cluster.run([
+        ("A", 0.0, ["--work", "2.5"] + _FAST_LEASE),
+        ("B", 0.3, ["--work", "0.1"] + _FAST_LEASE),
+    ])
+    errors = []
+    for node, (code, _) in sorted(outcome.items()):
+        _check(code == 0, "node {} exited with {}".format(node, code), errors)
+    _check_each_task_once(cluster, errors)
+    for number in range(1, cluster.tasks + 1):
+        task_id = "{:04d}".format(number)
+        _check(cluster.expired(task_id) == 0,
+               "lease for task {} expired despite heartbeats".format(task_id), errors)
+    _check_single_summary(outcome, 3, errors)
+    return errors
+
+
+def scenario_attempts(work_dir):
+    # type: (str) -> list
+    cluster = _Cluster(work_dir, "attempts", tasks=1)
+    extra = ["--work", "0.1", "--crash-on", "P01.wbpj", "--max-attempts", "2"] + _FAST_LEASE
+    outcome = cluster.run([("A", 0.0, extra), ("B", 0.3, extra), ("C", 0.6, extra)])
+    errors = []
+    codes = sorted(code for code, _ in outcome.values())
+    _check(codes == [0, CRASH_EXIT_CODE, CRASH_EXIT_CODE],
+           "exit codes were {}".format(codes), errors)
+    results = _check_each_task_once(cluster, errors)
+    result = results.get("0001", [{}])[0]
+    _check(result.get("success") is False and "expired 2 times" in (result.get("error") or ""),
+           "task 0001 was not given up after 2 expired leases: {}".format(result.get("error")),
+           errors)
+    _check_single_summary(outcome, 1, errors)
+    return errors
+
+
+def scenario_rerun(work_dir):
+    # type: (str) -> list
+    cluster = _Cluster(work_dir, "rerun", tasks=2)
+    first = cluster.run([("A", 0.0, ["--work", "0.1"])])
+    second = cluster.run([("B", 0.0, ["--work", "0.1"])])
+    errors = []
+    _check(first["A"][0] == 0, "first node exited with {}".format(first["A"][0]), errors)
+    _check(second["B"][0] == 2,
+           "node joining a completed queue exited with {}".format(second["B"][0]), errors)
+    _check(not _summaries(second), "node joining a completed queue sent a summary", errors)
+    return errors
+
+
+def scenario_stalled(work_dir):
+    # type: (str) -> list
+    cluster = _Cluster(work_dir, "stalled", tasks=2)
+    outcome = cluster.run([
+        ("A", 0.0, ["--work", "0.1", "--stall-on", "P01.wbpj"] + _FAST_LEASE),
+        ("B", 0.3, ["--work", "0.1"] + _FAST_LEASE),
+    ])
+    errors = []
+    for node, (code, _) in sorted(outcome.items()):
+        _check(code == 0, "node {} exited with {}".format(node, code), errors)
+    _check("LOST P01.wbpj" in outcome["A"][1], "node A did not notice the lost lease", errors)
+    results = _check_each_task_once(cluster, errors)
+    _check(results.get("0001", [{}])[0].get("node") == "B",
+           "task 0001 was not completed by node B", errors)
+
+    # 後から書き込まれた失敗の結果より、成功の結果を優先する
+    write_json_atomic(os.path.join(cluster.root, "results", "0001.Z.json"), {
+        "task_id": "0001", "node": "Z", "project": "P01.wbpj", "success": False,
+        "completed": "9999-12-31 00:00:00.000000",
+    })
+    DISTRIBUTED_CONFIG.update({"queue_dir": cluster.queue_dir, "batch_id": None,
+                               "run_tag": cluster.run_tag, "node_name": "check"})
+    queue = WorkQueue(logging.getLogger("queue_check"), _project_names(cluster.tasks))
+    queue.task_ids = read_json(os.path.join(cluster.root, "batch.json"), {}).get("tasks", [])
+    collected = queue.collect_results()
+    _check(bool(collected) and collected[0].get("node") == "B" and collected[0].get("success"),
+           "collect_results preferred a later failure over a success", errors)
+    return errors
+
+
+def main(argv=None):
+    # type: (list) -> int
+    """コマンドラインから実行"""
+    parser = argparse.ArgumentParser(
+        description="Run simulated worker processes against a temporary work queue"
+    )
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary queue directory and worker logs")
+
+    # ワーカーとして起動された場合の引数
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--queue-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--run-tag", help=argparse.SUPPRESS)
+    parser.add_argument("--node", help=argparse.SUPPRESS)
+    parser.add_argument("--tasks", type=int, default=3, help=argparse.SUPPRESS)
+    parser.add_argument("--work", type=float, default=0.1, help=argparse.SUPPRESS)
+    parser.add_argument("--crash-on", nargs="*", default=[], help=argparse.SUPPRESS)
+    parser.add_argument("--stall-on", nargs="*", default=[], help=argparse.SUPPRESS)
+    parser.add_argument("--lease", type=float, default=5.0, help=argparse.SUPPRESS)
+    parser.add_argument("--heartbeat", type=float, default=0.5, help=argparse.SUPPRESS)
+    parser.add_argument("--poll", type=float, default=0.2, help=argparse.SUPPRESS)
+    parser.add_argument("--max-attempts", type=int, default=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return run_worker(args)
+
+    work_dir = tempfile.mkdtemp(prefix="queue_check_")
+    failed = 0
+    try:
+        for name in args.scenario:
+            errors = globals()["scenario_" + name](work_dir)
+            if errors:
+                failed += 1
+                print("FAIL {}".format(name))
+                for error in errors:
+                    print("  - {}".format(error))
+            else:
+                print("PASS {}".format(name))
+    finally:
+        if args.keep:
+            print("Queue directory and worker logs kept in {}".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+性能の退行検出
+
+今回の実行の処理時間を、同じプロジェクトの過去の実行（実行履歴）から作った
+ベースラインと比較し、統計的に有意な遅延・高速化を検出する
+
+比較する指標:
+    dp_mean: 更新した設計ポイントの平均処理時間（プロジェクト単位）
+    open / save: プロジェクトの Open / Save の時間
+    dp:      設計ポイントごとの処理時間（同じ ID の設計ポイントが過去にも更新されている場合）
+
+判定:
+    処理時間の対数をとり、ベースライン n 件の平均と標準偏差から作った予測区間
+    (t 分布、自由度 n-1) の外にあり、かつ変化率が min_relative_change 以上のものを検出する
+"""
+
+import os
+import math
+import logging
+from datetime import datetime
+
+from config import LOG_CONFIG, REGRESSION_CONFIG
+from fs_utils import write_json_atomic
+from work_queue import node_file_path
+
+
+# 両側検定の t 分布の臨界値（自由度 1-30、以降は 40 / 60 / 120）
+_T_TABLE = {
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750],
+}
+_T_TABLE_LARGE = {
+    0.95: [(40, 2.021), (60, 2.000), (120, 1.980)],
+    0.99: [(40, 2.704), (60, 2.660), (120, 2.617)],
+}
+
+
+def t_critical(df, confidence=0.95):
+    # type: (int, float) -> float
+    """
+    両側検定の t 分布の臨界値
+
+    表にない自由度は、それ以下で最も近い自由度の値を使う（保守的な側）
+    """
+    if confidence not in _T_TABLE:
+        raise ValueError("Unsupported confidence level: {}".format(confidence))
+    if df < 1:
+        raise ValueError("Degrees of freedom must be at least 1")
+    if df <= len(_T_TABLE[confidence]):
+        return _T_TABLE[confidence][df - 1]
+
+    value = _T_TABLE[confidence][-1]
+    for table_df, table_value in _T_TABLE_LARGE[confidence]:
+        if df < table_df:
+            return value
+        value = table_value
+    return value
+
+
+def detect_regressions(current_run, history_runs):
+    # type: (dict, list) -> dict
+    """
+    今回の実行をベースラインと比較
+
+    Args:
+        current_run (dict): 今回の実行履歴レコード（run_history.build_run_record の戻り値）
+        history_runs (list): 過去の実行履歴レコードのリスト（古い順、今回の実行は含めない）
+
+    Returns:
+        dict: 比較結果
+            {
+                "run_started": str,
+                "checked": int,       # 比較した指標の数
+                "insufficient": int,  # ベースラインが足りず比較できなかった指標の数
+                "findings": list,     # 有意な変化（slower / faster）
+                "comparisons": list,  # 比較した全ての指標（ダッシュボード用）
+            }
+    """
+    baseline_runs = REGRESSION_CONFIG.get("baseline_runs", 10)
+    min_samples = max(2, REGRESSION_CONFIG.get("min_samples", 3))
+
+    report = {
+        "run_started": current_run.get("started"),
+        "checked": 0,
+        "insufficient": 0,
+        "findings": [],
+        "comparisons": [],
+    }
+
+    for project in current_run.get("projects", []):
+        # 途中で途切れた記録など、プロジェクトを識別できないものは比較しない
+        key = _project_key(project)
+        if key is None:
+            continue
+        current_metrics = _project_metrics(project)
+        if not current_metrics:
+            continue
+
+        # 同じプロジェクトを含む直近の実行からベースラインを作る
+        baseline = {}
+        runs_found = 0
+        for run in reversed(history_runs):
+            if runs_found >= baseline_runs:
+                break
+            for past in run.get("projects", []):
+                if _project_key(past) != key:
+                    continue
+                runs_found += 1
+                for metric, value in _project_metrics(past).items():
+                    baseline.setdefault(metric, []).append(value)
+                break
+
+        for metric in sorted(current_metrics, key=lambda m: (m[0], m[1] or "")):
+            samples = baseline.get(metric, [])
+            comparison = None
+            if len(samples) >= min_samples:
+                comparison = compare(current_metrics[metric], samples)
+            if comparison is None:
+                report["insufficient"] += 1
+                continue
+            comparison["project"] = project.get("project") or os.path.basename(key)
+            comparison["metric"] = metric[0]
+            comparison["dp"] = metric[1]
+            report["checked"] += 1
+            report["comparisons"].append(comparison)
+            if comparison["status"] != "ok":
+                report["findings"].append(comparison)
+
+    return report
+
+
+def compare(value, samples):
+    # type: (float, list) -> dict
+    """
+    1つの値をベースラインのサンプルと比較
+
+    対数変換した値で予測区間の t 検定を行い、変化率の閾値と組み合わせて判定する
+    対数をとれない 0 以下の値は除く
+
+    Returns:
+        dict: {"current", "baseline_mean", "samples", "change", "t", "t_critical", "status"}
+            status は "slower" / "faster" / "ok"
+            今回の値が 0 以下、または正のサンプルが2件未満の場合は None
+    """
+    confidence = REGRESSION_CONFIG.get("confidence", 0.95)
+    min_change = REGRESSION_CONFIG.get("min_relative_change", 0.2)
+
+    samples = [sample for sample in samples if _is_positive(sample)]
+    if not _is_positive(value) or len(samples) < 2:
+        return None
+
+    logs = [math.log(sample) for sample in samples]
+    n = len(logs)
+    mean = sum(logs) / n
+    variance = sum((x - mean) ** 2 for x in logs) / (n - 1)
+    spread = math.sqrt(variance) * math.sqrt(1.0 + 1.0 / n)
+
+    baseline = math.exp(mean)  # 幾何平均
+    change = value / baseline - 1.0
+    diff = math.log(value) - mean
+    if spread > 0:
+        t = diff / spread
+    else:
+        t = float("inf") if diff > 0 else (float("-inf") if diff < 0 else 0.0)
+    critical = t_critical(n - 1, confidence)
+
+    status = "ok"
+    if abs(t) > critical and abs(change) >= min_change:
+        status = "slower" if change > 0 else "faster"
+
+    return {
+        "current": round(value, 3),
+        "baseline_mean": round(baseline, 3),
+        "samples": n,
+        "change": round(change, 4),
+        "t": round(t, 3) if not math.isinf(t) else None,
+        "t_critical": critical,
+        "status": status,
+    }
+
+
+def write_regression_report(report, logger):
+    # type: (dict, logging.Logger) -> bool
+    """比較結果を JSON で出力（毎回上書き、分散実行ではノードごと）"""
+    report_file = node_file_path(REGRESSION_CONFIG.get("report_file") or os.path.join(
+        LOG_CONFIG.get("log_dir", "."), "regression_report.json"
+    ))
+    data = dict(report)
+    data["generated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    data["confidence"] = REGRESSION_CONFIG.get("confidence", 0.95)
+    data["min_relative_change"] = REGRESSION_CONFIG.get("min_relative_change", 0.2)
+    try:
+        write_json_atomic(report_file, data)
+        logger.info("Regression report written: {}".format(report_file))
+        return True
+    except Exception as e:
+        logger.warning("Failed to write regression report: {}".format(str(e)))
+        return False
+
+
+def format_regression_section(report):
+    # type: (dict) -> str
+    """全体完了通知に載せる性能比較の結果"""
+    lines = []
+    lines.append("性能比較（過去の実行との比較）:")
+    lines.append("  比較した指標: {}（ベースライン不足 {}）".format(
+        report["checked"], report["insufficient"]
+    ))
+
+    slower = [f for f in report["findings"] if f["status"] == "slower"]
+    faster = [f for f in report["findings"] if f["status"] == "faster"]
+    if not report["findings"]:
+        lines.append("  有意な変化はありません")
+    for label, findings in (("遅延", slower), ("高速化", faster)):
+        for finding in sorted(findings, key=lambda f: -abs(f["change"])):
+            lines.append("  [{}] {} {}: {:.1f} 秒 (基準 {:.1f} 秒, {:+.0f}%, n={})".format(
+                label, finding["project"], _metric_label(finding),
+                finding["current"], finding["baseline_mean"],
+                finding["change"] * 100, finding["samples"]
+            ))
+    return "\n".join(lines)
+
+
+def _project_key(project):
+    # type: (dict) -> str
+    """実行をまたいで同じプロジェクトを識別するキー（識別できない場合は None）"""
+    if project.get("path"):
+        return os.path.normcase(os.path.abspath(project["path"]))
+    return project.get("project")
+
+
+def _project_metrics(project):
+    # type: (dict) -> dict
+    """
+    実行履歴の1プロジェクト分から比較する指標を取り出す
+
+    同時に更新した設計ポイントや、必要なキーが欠けている・0 以下の値は対象外
+
+    Returns:
+        dict: {(指標名, 設計ポイント名 or None): 秒}
+    """
+    min_seconds = REGRESSION_CONFIG.get("min_seconds", 1.0)
+    metrics = {}
+
+    solved = [dp for dp in project.get("dps", [])
+              if dp.get("success") and not dp.get("skipped") and "name" in dp
+              and dp.get("batch_size", 1) == 1
+              and _is_positive(dp.get("seconds")) and dp["seconds"] >= min_seconds]
+    if solved:
+        metrics[("dp_mean", None)] = sum(dp["seconds"] for dp in solved) / len(solved)
+    for dp in solved:
+        metrics[("dp", str(dp["name"]))] = dp["seconds"]
+
+    for name in ("open", "save"):
+        value = project.get(name + "_seconds")
+        if _is_positive(value) and value >= min_seconds:
+            metrics[(name, None)] = value
+    return metrics
+
+
+def _is_positive(value):
+    # type: (object) -> bool
+    """対数をとれる正の数値か"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def _metric_label(finding):
+    # type: (dict) -> str
+    labels = {
+        "dp_mean": "設計ポイント平均",
+        "open": "Open",
+        "save": "Save",
+    }
+    if finding["metric"] == "dp":
+        return "設計ポイント {}".format(finding["dp"])
+    return labels.get(finding["metric"], finding["metric"])
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+実行履歴
+
+1回の実行ごとに、プロジェクト・設計ポイント単位の処理時間を
+JSON Lines 形式（1行1実行）で追記する
+キャパシティシミュレーターなどのオフライン分析で使用する
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+
+from config import LOG_CONFIG, HISTORY_CONFIG
+from work_queue import node_file_path
+
+
+def get_history_file():
+    # type: () -> str
+    """実行履歴ファイルのパス（分散実行ではノードごと）"""
+    return node_file_path(HISTORY_CONFIG.get("history_file") or os.path.join(
+        LOG_CONFIG.get("log_dir", "."), "run_history.jsonl"
+    ))
+
+
+def build_run_record(start_time, end_time, project_results):
+    # type: (datetime, datetime, list) -> dict
+    """
+    実行履歴の1レコードを作成
+
+    Args:
+        start_time (datetime): 開始時刻
+        end_time (datetime): 終了時刻
+        project_results (list): process_project の戻り値のリスト
+
+    Returns:
+        dict: 実行履歴レコード
+    """
+    projects = []
+    for result in project_results:
+        projects.append({
+            "project": result["project"],
+            "path": result.get("path"),
+            "success": result["success"],
+            "elapsed_seconds": result.get("elapsed_seconds"),
+            "open_seconds": result.get("open_seconds"),
+            "save_seconds": result.get("save_seconds"),
+            "dps": result.get("dp_timings", []),
+        })
+
+    return {
+        "started": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "finished": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "elapsed_seconds": (end_time - start_time).total_seconds(),
+        "projects": projects,
+    }
+
+
+def append_run(record, logger=None):
+    # type: (dict, logging.Logger) -> bool
+    """
+    実行履歴ファイルにレコードを追記
+
+    Args:
+        record (dict): build_run_record で作成したレコード
+        logger (logging.Logger): ロガーインスタンス（オプション）
+
+    Returns:
+        bool: 書き込み成功時 True
+    """
+    history_file = get_history_file()
+    try:
+        directory = os.path.dirname(os.path.abspath(history_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(history_file, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+        if logger:
+            logger.info("Run history appended: {}".format(history_file))
+        return True
+    except Exception as e:
+        if logger:
+            logger.warning("Failed to write run history: {}".format(str(e)))
+        return False
+
+
+def load_runs(history_file=None):
+    # type: (str) -> list
+    """
+    実行履歴ファイルを読み込む（壊れた行は読み飛ばす）
+
+    Args:
+        history_file (str): 実行履歴ファイルのパス（省略時は設定値）
+
+    Returns:
+        list: 古い順の実行履歴レコードのリスト
+    """
+    history_file = history_file or get_history_file()
+    runs = []
+    if not os.path.exists(history_file):
+        return runs
+
+    with open(history_file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
@@ -16,23 +16,49 @@ from datetime import datetime, timedelta
 
 # カスタムモジュールのインポート
 try:
-    from config import PROJECTS
-    from logger import setup_logger
-    from email_utils import send_email, format_summary, create_subject, send_project_start_email
+    from config import PROJECTS, PREFLIGHT_CONFIG, ARCHIVE_CONFIG, PRUNE_CONFIG, HISTORY_CONFIG
+    from config import PROGRESS_CONFIG, SCHEDULE_CONFIG, REGRESSION_CONFIG, DISTRIBUTED_CONFIG
+    from logger import setup_logger, shutdown_logger
+    from email_utils import format_summary, create_subject
+    from email_utils import format_preflight_summary, create_preflight_subject
+    from notifier import NotificationPolicy
+    from archiver import ProjectArchiver
+    from pruner import SolverFilePruner, record_save_time, format_prune_section
+    from fs_utils import format_bytes
+    from run_history import build_run_record, append_run, load_runs
+    from regression import detect_regressions, write_regression_report
+    from regression import format_regression_section
+    from preflight import run_preflight, has_preflight_issues
+    from progress import ProgressReporter
+    from dp_selection import get_project_path, get_manifest_spec, load_manifest
+    from dp_selection import select_design_points
+    from scheduler import RunScheduler
+    from work_queue import WorkQueue
 except ImportError as e:
     print("Error importing modules: {}".format(str(e)))
     print("Make sure config.py, logger.py, and email_utils.py are in the same directory")
     sys.exit(1)
 
+# 分散実行でリースを失い、他のノードに処理を引き継いだプロジェクトのエラー
+LEASE_LOST_ERROR = "Lease lost to another node"
 
-def process_project(project_path, logger):
-    # type: (str, logging.Logger) -> dict
+
+def process_project(project_path, logger, progress=None, scheduler=None, manifest=None,
+                    lease=None):
+    # type: (str, logging.Logger, ProgressReporter, RunScheduler, object, object) -> dict
     """
     1つのプロジェクトを処理
 
     Args:
         project_path (str): プロジェクトファイル (.wbpj) のパス
         logger (logging.Logger): ロガーインスタンス
+        progress (ProgressReporter): 進捗の公開先（オプション）
+        scheduler (RunScheduler): 稼働時間帯のスケジューラー（オプション）
+            時間帯の外に出たら保存して待機し、次の時間帯で続きの設計ポイントから再開する
+        manifest (dict or str): 設計ポイント選択のマニフェスト、またはそのファイルパス（オプション）
+            指定した場合は選択した設計ポイントだけを優先順位の順に更新する
+        lease (callable): 分散実行でリースをまだ保持しているかを返す関数（オプション）
+            リースを失った場合は他のノードが処理し直すため、保存せずに処理を打ち切る
 
     Returns:
         dict: 処理結果
@@ -42,6 +68,15 @@ def process_project(project_path, logger):
                 "error": str or None,
                 "dp_total": int,
                 "dp_success": int,
+                "dp_selected": int,  # マニフェストで選択した設計ポイント数
+                "dp_skipped": int,   # マニフェストで対象外になった設計ポイント数
+                "dp_solved": int,    # 今回の実行で更新に成功した設計ポイント数
+                "path": str,
+                "open_seconds": float or None,
+                "save_seconds": float or None,
+                "dp_timings": list,  # 設計ポイントごとの処理時間
+                                     # まとめて更新したものは seconds が None で、
+                                     # batch_seconds / batch_size に全体の時間と数を記録
             }
     """
     result = {
@@ -50,6 +85,13 @@ def process_project(project_path, logger):
         "error": None,
         "dp_total": 0,
         "dp_success": 0,
+        "dp_selected": 0,
+        "dp_skipped": 0,
+        "dp_solved": 0,
+        "path": project_path,
+        "open_seconds": None,
+        "save_seconds": None,
+        "dp_timings": [],
     }
 
     try:
@@ -64,11 +106,25 @@ def process_project(project_path, logger):
             result["error"] = error_msg
             return result
 
+        # 設計ポイント選択のマニフェスト
+        try:
+            manifest = load_manifest(manifest, project_path)
+        except ValueError as e:
+            logger.error(str(e))
+            result["error"] = str(e)
+            return result
+
         # プロジェクトを開く
         logger.info("Opening project...")
+        if progress is not None:
+            progress.phase_started("open")
         try:
+            open_start = datetime.now()
             Open(FilePath=project_path)
+            result["open_seconds"] = (datetime.now() - open_start).total_seconds()
             logger.info("Project opened successfully")
+            if progress is not None:
+                progress.phase_finished()
         except Exception as e:
             error_msg = "Failed to open project: {}".format(str(e))
             logger.error(error_msg)
@@ -79,51 +135,152 @@ def process_project(project_path, logger):
         logger.info("Retrieving design points...")
         try:
             design_points = Parameters.GetAllDesignPoints()
-            dp_count = len(design_points)
-            result["dp_total"] = dp_count
-            logger.info("Found {} design point(s)".format(dp_count))
+            result["dp_total"] = len(design_points)
+            logger.info("Found {} design point(s)".format(len(design_points)))
+
+            # マニフェストで対象を絞り込み、優先順位の順に並べる
+            selected, skipped = select_design_points(
+                design_points, manifest, Parameters, logger
+            )
+            dp_count = len(selected)
+            result["dp_selected"] = dp_count
+            result["dp_skipped"] = skipped
+            if manifest is not None:
+                logger.info("Manifest selected {} design point(s), skipped {}".format(
+                    dp_count, skipped
+                ))
+            if progress is not None:
+                progress.set_dp_total(dp_count)
         except Exception as e:
             error_msg = "Failed to get design points: {}".format(str(e))
             logger.error(error_msg)
             result["error"] = error_msg
             # プロジェクトを閉じる前に保存を試みる
-            _safe_save(project_path, logger)
+            if not _lease_lost(lease, logger):
+                result["save_seconds"] = _safe_save(project_path, logger, progress)
             return result
 
+        # 保持済み設計ポイントの中間ファイル整理
+        pruner = None
+        if PRUNE_CONFIG.get("enabled", False):
+            pruner = SolverFilePruner(project_path, logger)
+        prune_each_dp = pruner is not None and PRUNE_CONFIG.get("stage", "project") == "dp"
+
         # 各設計ポイントを更新
         dp_success_count = 0
-        for i, dp in enumerate(design_points, 1):
-            try:
-                logger.info("Processing design point {}/{}...".format(i, dp_count))
-
-                # 既に更新済みかチェック
-                if dp.Retained:
-                    logger.info("Design point {} is already retained (updated)".format(i))
-                    dp_success_count += 1
+        updated_since_save = False
+        position = 0
+        while position < dp_count:
+            if _lease_lost(lease, logger):
+                result["error"] = LEASE_LOST_ERROR
+                return result
+
+            # 稼働時間帯の外では、保存してから次の時間帯まで待つ
+            batch_size = 1
+            if scheduler is not None:
+                if not scheduler.can_start():
+                    if updated_since_save:
+                        logger.info("Run window closing; saving project before pausing")
+                        _safe_save(project_path, logger, progress)
+                        updated_since_save = False
+                    scheduler.wait_for_window(progress)
+                batch_size = max(1, scheduler.concurrency())
+
+            # 同時に更新する設計ポイントを集める（更新済みのものは飛ばす）
+            batch = []
+            while position < dp_count and len(batch) < batch_size:
+                i, dp = selected[position]
+                position += 1
+                # ログにはマニフェストと対応が取れるよう Workbench の設計ポイント ID を出す
+                name = _get_dp_name(dp, i)
+                dp_timing = {"name": name, "seconds": 0.0,
+                             "success": False, "skipped": False}
+                result["dp_timings"].append(dp_timing)
+                try:
+                    logger.info("Processing design point {} ({}/{})...".format(
+                        name, position, dp_count
+                    ))
+
+                    # 既に更新済みかチェック
+                    if dp.Retained:
+                        logger.info("Design point {} is already retained (updated)".format(name))
+                        dp_success_count += 1
+                        dp_timing["success"] = True
+                        dp_timing["skipped"] = True
+                        if progress is not None:
+                            progress.dp_started(position)
+                            progress.dp_finished(True, skipped=True)
+                        continue
+                except Exception as e:
+                    logger.error("Failed to update design point {}: {}".format(name, str(e)))
                     continue
-
-                # 設計ポイントを更新
-                logger.info("Updating design point {}...".format(i))
-                dp.Update()
-
-                # 更新完了確認
-                if dp.Retained:
-                    logger.info("Design point {} updated successfully".format(i))
-                    dp_success_count += 1
-                else:
-                    logger.warning("Design point {} update completed but not retained".format(i))
-
-            except Exception as e:
-                logger.error("Failed to update design point {}: {}".format(i, str(e)))
-                # 1つの設計ポイントが失敗しても続行
+                batch.append((name, dp, dp_timing, position))
+
+            if not batch:
+                continue
+
+            if progress is not None:
+                progress.dp_started(batch[-1][3], len(batch))
+            update_error = _update_design_points(batch, logger)
+            updated_since_save = True
+
+            # 更新完了確認（1つの設計ポイントにつき結果のログは1行）
+            for name, dp, dp_timing, _ in batch:
+                try:
+                    if dp.Retained:
+                        logger.info("Design point {} updated successfully".format(name))
+                        dp_success_count += 1
+                        result["dp_solved"] += 1
+                        dp_timing["success"] = True
+                        if prune_each_dp:
+                            pruner.prune_design_point(dp)
+                    elif update_error is not None:
+                        logger.error("Failed to update design point {}: {}".format(
+                            name, update_error
+                        ))
+                    else:
+                        logger.warning("Design point {} update completed but not retained".format(
+                            name
+                        ))
+                except Exception as e:
+                    logger.error("Failed to update design point {}: {}".format(name, str(e)))
+                    # 1つの設計ポイントが失敗しても続行
+
+                if progress is not None:
+                    progress.dp_finished(dp_timing["success"])
 
         result["dp_success"] = dp_success_count
         logger.info("Design points summary: {}/{} successful".format(
             dp_success_count, dp_count
         ))
 
+        if _lease_lost(lease, logger):
+            result["error"] = LEASE_LOST_ERROR
+            return result
+
+        # 保存前に中間ファイルを整理（保存対象を減らす）
+        if pruner is not None and not prune_each_dp:
+            pruner.prune_design_points([dp for _, dp in selected])
+
         # プロジェクトを保存
-        _safe_save(project_path, logger)
+        save_seconds = _safe_save(project_path, logger, progress)
+        result["save_seconds"] = save_seconds
+
+        # 整理の前後を比較できるよう、保存時間は整理が無効の実行でも記録する
+        previous_save, unpruned_save = None, None
+        if save_seconds is not None:
+            previous_save, unpruned_save = record_save_time(
+                project_path, save_seconds, pruned=pruner is not None
+            )
+
+        if pruner is not None:
+            result["prune"] = dict(pruner.stats)
+            result["prune"]["save_seconds"] = save_seconds
+            result["prune"]["previous_save_seconds"] = previous_save
+            result["prune"]["unpruned_save_seconds"] = unpruned_save
+            logger.info("Pruning freed {} in total".format(
+                format_bytes(pruner.stats["bytes_freed"])
+            ))
 
         # 全ての設計ポイントが成功した場合のみ success = True
         if dp_success_count == dp_count:
@@ -141,19 +298,103 @@ def process_project(project_path, logger):
     return result
 
 
-def _safe_save(project_path, logger):
-    # type: (str, logging.Logger) -> None
+def _node_total(work_queue, processed, default):
+    # type: (WorkQueue, int, int) -> int
+    """
+    分散実行でこのノードから見た総プロジェクト数
+
+    このノードの処理済み数にキューの残りを足す（他のノードが処理した分は含めない）
+    キューを読めない場合は default を返す
+    """
+    remaining = work_queue.remaining_count()
+    if remaining is None:
+        return default
+    return processed + remaining
+
+
+def _lease_lost(lease, logger):
+    # type: (object, logging.Logger) -> bool
+    """分散実行でリースを失っていれば True（他のノードと同じプロジェクトを保存しないため）"""
+    if lease is None or lease():
+        return False
+    logger.warning("Lease lost to another node; stopping without saving the project")
+    return True
+
+
+def _update_design_points(batch, logger):
+    # type: (list, logging.Logger) -> str
+    """
+    設計ポイントを更新
+
+    1つの場合は dp.Update()、複数の場合は UpdateAllDesignPoints でまとめて更新する
+    （同時に計算される数は Workbench の設計ポイント更新オプションに従う）
+    例外は握りつぶし、成否は呼び出し側で Retained を見て判定する
+
+    Args:
+        batch (list): (設計ポイント ID, 設計ポイント, 処理時間の記録, 処理順) のリスト
+        logger (logging.Logger): ロガーインスタンス
+
+    Returns:
+        str: 更新で例外が発生した場合はそのメッセージ、それ以外は None
+    """
+    numbers = ", ".join(str(item[0]) for item in batch)
+    if len(batch) == 1:
+        logger.info("Updating design point {}...".format(numbers))
+    else:
+        logger.info("Updating design points {} together...".format(numbers))
+
+    dp_start = datetime.now()
+    try:
+        if len(batch) == 1:
+            batch[0][1].Update()
+        else:
+            UpdateAllDesignPoints(DesignPoints=[item[1] for item in batch])
+        return None
+    except Exception as e:
+        return str(e)
+    finally:
+        seconds = (datetime.now() - dp_start).total_seconds()
+        for item in batch:
+            dp_timing = item[2]
+            if len(batch) == 1:
+                dp_timing["seconds"] = seconds
+            else:
+                # まとめて更新した場合は1つあたりの時間が分からないため、全体の時間だけを記録する
+                dp_timing["seconds"] = None
+                dp_timing["batch_seconds"] = seconds
+                dp_timing["batch_size"] = len(batch)
+
+
+def _get_dp_name(dp, index):
+    # type: (object, int) -> str
+    """設計ポイントの名前（ID）を取得。取得できない場合は dp_selection と同じく index - 1 を返す"""
+    try:
+        return str(dp.Name)
+    except Exception:
+        return str(index - 1)
+
+
+def _safe_save(project_path, logger, progress=None):
+    # type: (str, logging.Logger, ProgressReporter) -> float
     """
     プロジェクトを安全に保存
 
     Args:
         project_path (str): プロジェクトファイルのパス
         logger (logging.Logger): ロガーインスタンス
+        progress (ProgressReporter): 進捗の公開先（オプション）
+
+    Returns:
+        float: 保存にかかった時間（秒）。保存できなかった場合は None
     """
+    if progress is not None:
+        progress.phase_started("save")
+    save_start = datetime.now()
     try:
         logger.info("Saving project...")
         Save()
         logger.info("Project saved successfully")
+        return (datetime.now() - save_start).total_seconds()
     except Exception as e:
         logger.error("Failed to save project: {}".format(str(e)))
 
@@ -163,8 +404,13 @@ def _safe_save(project_path, logger):
             logger.info("Attempting to save as backup: {}".format(backup_path))
             Save(FilePath=backup_path)
             logger.info("Project saved as backup successfully")
+            return (datetime.now() - save_start).total_seconds()
         except Exception as e2:
             logger.error("Failed to save backup: {}".format(str(e2)))
+            return None
+    finally:
+        if progress is not None:
+            progress.phase_finished()
 
 
 def _get_backup_path(original_path):
@@ -219,8 +465,15 @@ def _format_single_project_summary(project_number, total_projects, result,
     if result["dp_total"] > 0:
         lines.append("設計ポイント:")
         lines.append("  総数: {}".format(result["dp_total"]))
+        if result.get("dp_skipped"):
+            lines.append("  選択: {}".format(result["dp_selected"]))
+            lines.append("  対象外: {}".format(result["dp_skipped"]))
         lines.append("  成功: {}".format(result["dp_success"]))
-        lines.append("  失敗: {}".format(result["dp_total"] - result["dp_success"]))
+        lines.append("  うち今回更新: {}".format(result.get("dp_solved", 0)))
+        lines.append("  失敗: {}".format(result["dp_selected"] - result["dp_success"]))
+        failed = [dp["name"] for dp in result.get("dp_timings", []) if not dp["success"]]
+        if failed:
+            lines.append("  失敗した設計ポイント ID: {}".format(", ".join(failed)))
         lines.append("")
 
     # エラー情報
@@ -261,6 +514,41 @@ def _create_single_project_subject(project_number, total_projects, result):
     )
 
 
+def _run_preflight_stage(logger, notifier):
+    # type: (logging.Logger, NotificationPolicy) -> tuple
+    """
+    事前チェックを実行し、問題があれば1通のレポートメールを送信
+
+    Args:
+        logger (logging.Logger): ロガーインスタンス
+        notifier (NotificationPolicy): メール通知の送信ポリシー
+
+    Returns:
+        tuple: (projects_to_run, dropped_results)
+            projects_to_run (list): 実行順に並べた PROJECTS のエントリ
+            dropped_results (list): 除外したプロジェクトの処理結果リスト
+    """
+    report = run_preflight(PROJECTS, logger, _get_backup_path)
+
+    if has_preflight_issues(report):
+        summary = format_preflight_summary(report, len(PROJECTS))
+        subject = create_preflight_subject(report, len(PROJECTS))
+        notifier.send_immediate(subject, summary)
+
+    dropped_results = []
+    for entry in report["dropped"]:
+        dropped_results.append({
+            "project": os.path.basename(entry["project"]),
+            "success": False,
+            "error": "Preflight: {}".format("; ".join(entry["errors"])),
+            "dp_total": 0,
+            "dp_success": 0,
+            "path": entry["project"],
+        })
+
+    return report["runnable"], dropped_results
+
+
 def main():
     # type: () -> None
     """
@@ -279,42 +567,128 @@ def main():
     logger.info("Start time: {}".format(start_time.strftime("%Y-%m-%d %H:%M:%S")))
     logger.info("Total projects to process: {}".format(len(PROJECTS)))
 
+    # メール通知の送信ポリシー
+    notifier = NotificationPolicy(email_handler, logger, len(PROJECTS))
+
+    # 分散実行（共有フォルダの作業キューから複数ノードでプロジェクトを取り出す）
+    work_queue = None
+    if DISTRIBUTED_CONFIG.get("enabled", False):
+        try:
+            work_queue = WorkQueue(logger, PROJECTS)
+        except ValueError as e:
+            logger.error("Invalid DISTRIBUTED_CONFIG: {}".format(str(e)))
+            shutdown_logger()
+            sys.exit(1)
+
+    # 事前チェック（分散実行ではタスクを登録するノードのみ）
+    projects_to_run = list(PROJECTS)
+    preflight_results = []
+    if work_queue is None or work_queue.try_seed():
+        if PREFLIGHT_CONFIG.get("enabled", True):
+            projects_to_run, preflight_results = _run_preflight_stage(logger, notifier)
+        if work_queue is not None:
+            # 除外したプロジェクトは全体完了通知を送るノードが collect_results() で受け取る
+            work_queue.seed(projects_to_run, preflight_results)
+            preflight_results = []
+    if work_queue is not None:
+        if not work_queue.wait_until_ready():
+            shutdown_logger()
+            sys.exit(1)
+        projects_to_run = work_queue.task_ids
+        work_queue.start()
+    total_to_run = len(projects_to_run)
+    notifier.total_projects = total_to_run
+
+    # 稼働時間帯のスケジューラー
+    scheduler = None
+    if SCHEDULE_CONFIG.get("enabled", False):
+        try:
+            scheduler = RunScheduler(logger)
+        except ValueError as e:
+            logger.error("Invalid SCHEDULE_CONFIG: {}".format(str(e)))
+            shutdown_logger()
+            sys.exit(1)
+
+    # 進捗の公開（ステータスファイル・ローカル HTTP エンドポイント）
+    progress = None
+    if PROGRESS_CONFIG.get("enabled", True):
+        # 分散実行では他のノードが処理する分を残り時間に含めない
+        progress = ProgressReporter(total_to_run if work_queue is None else None, logger)
+        progress.start()
+
+    # 処理済みプロジェクトのバックグラウンドアーカイブ
+    archiver = None
+    if ARCHIVE_CONFIG.get("enabled", False):
+        archiver = ProjectArchiver(logger)
+
     # 各プロジェクトを処理
     project_results = []
     successful_count = 0
 
-    for i, project_path in enumerate(PROJECTS, 1):
-        # プロジェクト開始時のメール通知を送信
+    if work_queue is not None:
+        # 稼働時間帯の外ではリースを取らずに待つ（待っている間は他のノードが取り出せる）
+        wait = None
+        if scheduler is not None:
+            wait = lambda: scheduler.wait_for_window(progress)
+        entries = work_queue.entries(before_claim=wait)
+    else:
+        entries = projects_to_run
+    for i, entry in enumerate(entries, 1):
+        project_path = get_project_path(entry)
+
+        # 稼働時間帯の外では次の時間帯まで待ってから開く
+        if scheduler is not None and work_queue is None:
+            scheduler.wait_for_window(progress)
+
+        # プロジェクト開始を通知（ダイジェスト設定時はまとめて送信）
         project_start_time = datetime.now()
         project_name = os.path.basename(project_path)
 
-        start_log = email_handler.get_logs()
-        send_project_start_email(
+        if work_queue is not None:
+            total_to_run = _node_total(work_queue, i - 1, total_to_run)
+            notifier.total_projects = total_to_run
+        notifier.project_started(
             project_number=i,
-            total_projects=len(PROJECTS),
             project_name=project_name,
             start_time=project_start_time,
             overall_successful=successful_count,
-            overall_processed=i - 1,
-            full_log=start_log,
-            logger=logger
+            overall_processed=i - 1
         )
 
         # プロジェクトを処理
-        result = process_project(project_path, logger)
+        if progress is not None:
+            progress.project_started(i, project_name)
+        result = process_project(
+            project_path, logger, progress, scheduler, manifest=get_manifest_spec(entry),
+            lease=work_queue.lease_held if work_queue is not None else None
+        )
         project_results.append(result)
+        if progress is not None:
+            progress.project_finished(result["success"])
 
         if result["success"]:
             successful_count += 1
 
+        # 保存済みのプロジェクトを圧縮（次のプロジェクトの処理と並行して実行）
+        if archiver is not None:
+            if result["success"] or not ARCHIVE_CONFIG.get("only_successful", True):
+                archiver.submit(project_path)
+
         # プロジェクト完了ごとにメール送信
         project_end_time = datetime.now()
         project_elapsed_time = project_end_time - project_start_time
+        result["elapsed_seconds"] = project_elapsed_time.total_seconds()
+
+        # 分散実行では結果を共有フォルダに書き込み、リースを返す
+        if work_queue is not None:
+            work_queue.complete(result)
+            total_to_run = _node_total(work_queue, i, total_to_run)
+            notifier.total_projects = total_to_run
 
         # 個別プロジェクトのサマリーを作成
         project_summary = _format_single_project_summary(
             project_number=i,
-            total_projects=len(PROJECTS),
+            total_projects=total_to_run,
             result=result,
             elapsed_time=project_elapsed_time,
             overall_successful=successful_count,
@@ -322,13 +696,33 @@ def main():
         )
 
         # 個別プロジェクトのメール件名を作成
-        project_subject = _create_single_project_subject(i, len(PROJECTS), result)
+        project_subject = _create_single_project_subject(i, total_to_run, result)
 
-        # 現在までのログを取得
-        full_log = email_handler.get_logs()
+        # 完了を通知（失敗は即時送信）
+        notifier.project_finished(
+            project_subject, project_summary, result["success"],
+            overall_successful=successful_count,
+            overall_processed=i
+        )
 
-        # メール送信
-        send_email(project_subject, project_summary, full_log, logger)
+    # 最終状態を書き込んで進捗の公開を終了
+    if progress is not None:
+        progress.finish()
+    if work_queue is not None:
+        work_queue.close()
+
+    # 事前チェックで除外したプロジェクトは失敗として扱う
+    project_results.extend(preflight_results)
+
+    # アーカイブの完了を待つ
+    extra_sections = []
+    if PRUNE_CONFIG.get("enabled", False):
+        extra_sections.append(format_prune_section(project_results))
+    if scheduler is not None:
+        extra_sections.append(scheduler.format_section())
+    if archiver is not None:
+        archiver.wait()
+        extra_sections.append(archiver.format_section())
 
     # 処理完了
     end_time = datetime.now()
@@ -339,27 +733,68 @@ def main():
     logger.info("*" * 60)
     logger.info("End time: {}".format(end_time.strftime("%Y-%m-%d %H:%M:%S")))
     logger.info("Total time: {}".format(elapsed_time))
-    logger.info("Successful projects: {}/{}".format(successful_count, len(PROJECTS)))
-
-    # サマリーとメール送信
-    summary = format_summary(
-        total_projects=len(PROJECTS),
-        successful_projects=successful_count,
-        failed_projects=len(PROJECTS) - successful_count,
-        project_results=project_results,
-        elapsed_time=elapsed_time
-    )
+    # 事前チェックで無視した重複エントリと、分散実行で他のノードが処理した分は数えない
+    expected_count = len(project_results)
+    logger.info("Successful projects: {}/{}".format(successful_count, expected_count))
+
+    run_record = build_run_record(start_time, end_time, project_results)
+
+    # 過去の実行と処理時間を比較（今回の実行を記録する前の履歴をベースラインにする）
+    if REGRESSION_CONFIG.get("enabled", True):
+        regression = detect_regressions(run_record, load_runs())
+        for finding in regression["findings"]:
+            logger.warning("Performance {}: {} {} {:.1f} s (baseline {:.1f} s, {:+.0f}%)".format(
+                finding["status"], finding["project"],
+                finding["metric"] if finding["dp"] is None else "dp " + finding["dp"],
+                finding["current"], finding["baseline_mean"], finding["change"] * 100
+            ))
+        write_regression_report(regression, logger)
+        extra_sections.append(format_regression_section(regression))
+
+    # 実行履歴を記録（キャパシティシミュレーターなどで使用）
+    if HISTORY_CONFIG.get("enabled", True):
+        append_run(run_record, logger)
+
+    # 溜まっているダイジェストを先に送信
+    notifier.flush()
+
+    # 全体完了通知の対象（分散実行では選ばれた1ノードが全ノードの結果をまとめて送る）
+    summary_results = project_results
+    summary_total = len(project_results)
+    send_summary = True
+    if work_queue is not None:
+        send_summary = work_queue.elect_summary()
+        if send_summary:
+            summary_results = work_queue.collect_results()
+            summary_total = len(summary_results)
+            logger.info("Assembling combined summary for {} project(s)".format(summary_total))
+        else:
+            logger.info("Combined summary will be sent by another node")
+    summary_successful = len([r for r in summary_results if r["success"]])
+
+    if send_summary:
+        # サマリーとメール送信
+        summary = format_summary(
+            total_projects=summary_total,
+            successful_projects=summary_successful,
+            failed_projects=summary_total - summary_successful,
+            project_results=summary_results,
+            elapsed_time=elapsed_time,
+            extra_sections=extra_sections + [notifier.format_section()]
+        )
 
-    subject = create_subject(successful_count, len(PROJECTS))
-    full_log = email_handler.get_logs()
+        subject = create_subject(summary_successful, summary_total)
 
-    # メール送信
-    send_email(subject, summary, full_log, logger)
+        # メール送信（送信上限に関わらず必ず送信）
+        notifier.send_final(subject, summary)
 
     logger.info("Script finished")
 
+    # キューに残ったログを出力し切ってから終了
+    shutdown_logger()
+
     # 終了コード
-    if successful_count == len(PROJECTS):
+    if successful_count == expected_count:
         sys.exit(0)  # 全て成功
     else:
         sys.exit(1)  # 一部または全て失敗
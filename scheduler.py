@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+稼働時間帯のスケジューラー
+
+曜日と時刻で指定した稼働時間帯（夜間・週末など）の中でだけ
+新しいプロジェクトや設計ポイントを開始する
+時間帯ごとに同時に更新する設計ポイント数を設定でき、
+時間帯の外では次の時間帯が始まるまで待つ
+"""
+
+import time
+import logging
+from datetime import datetime, timedelta
+
+from config import SCHEDULE_CONFIG
+
+
+# 曜日名と datetime.weekday() の対応
+_DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+class RunWindow(object):
+    """
+    1つの稼働時間帯
+
+    end が start 以前の場合は日をまたぐ時間帯（例: 19:00-07:00）として扱う
+    days は時間帯が始まる曜日
+    """
+    def __init__(self, days, start, end, concurrency=1):
+        # type: (set, int, int, int) -> None
+        self.days = days
+        self.start = start  # 0:00 からの分
+        self.end = end
+        self.concurrency = concurrency
+
+    @property
+    def overnight(self):
+        # type: () -> bool
+        return self.end <= self.start
+
+    def occurrence(self, now):
+        # type: (datetime) -> tuple
+        """now を含む時間帯の (開始, 終了) を返す。含まない場合は None"""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day_offset in (0, -1):
+            start = today + timedelta(days=day_offset, minutes=self.start)
+            if start.weekday() not in self.days:
+                continue
+            end = today + timedelta(days=day_offset, minutes=self.end)
+            if self.overnight:
+                end += timedelta(days=1)
+            if start <= now < end:
+                return start, end
+        return None
+
+    def next_start(self, now):
+        # type: (datetime) -> datetime
+        """now より後で最初に時間帯が始まる時刻"""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day_offset in range(0, 8):
+            start = today + timedelta(days=day_offset, minutes=self.start)
+            if start > now and start.weekday() in self.days:
+                return start
+        return None
+
+    def next_end(self, now):
+        # type: (datetime) -> datetime
+        """now より後で最初に時間帯が終わる時刻（now を含む時間帯の終了を含む）"""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day_offset in range(-1, 8):
+            start = today + timedelta(days=day_offset, minutes=self.start)
+            if start.weekday() not in self.days:
+                continue
+            end = today + timedelta(days=day_offset, minutes=self.end)
+            if self.overnight:
+                end += timedelta(days=1)
+            if end > now:
+                return end
+        return None
+
+
+class RunScheduler(object):
+    """
+    稼働時間帯の判定と待機
+
+    can_start() で新しい作業を開始できるかを判定し、
+    開始できない場合は wait_for_window() で次の時間帯まで待つ
+    """
+    def __init__(self, logger, windows=None):
+        # type: (logging.Logger, list) -> None
+        self.logger = logger
+        if windows is None:
+            windows = SCHEDULE_CONFIG.get("windows", [])
+        self.windows = [parse_window(window) for window in windows]
+        if not self.windows:
+            raise ValueError("SCHEDULE_CONFIG has no run windows")
+
+        self.check_interval = SCHEDULE_CONFIG.get("check_interval_seconds", 60)
+        self.stop_margin = timedelta(minutes=SCHEDULE_CONFIG.get("stop_margin_minutes", 0))
+        self.paused_seconds = 0.0
+        self.pause_count = 0
+
+    def current(self, now=None):
+        # type: (datetime) -> tuple
+        """
+        現在の時間帯を返す
+
+        複数の時間帯が重なる場合は同時実行数の大きい方を優先する
+        ただし同時実行数 0 の時間帯（停止時間帯）が含まれる場合は停止を優先する
+        終了時刻は、続けて始まる時間帯（土曜 00:00-24:00 の後の日曜 00:00-24:00 など）もたどり、
+        稼働時間帯が途切れるか停止時間帯が始まる時刻とする
+
+        Returns:
+            tuple: (同時実行数, 稼働が途切れる時刻)。時間帯の外では (0, None)
+        """
+        now = now or datetime.now()
+        concurrency, end = self._window_at(now)
+        if concurrency == 0:
+            return (0, None)
+
+        # 常に稼働する設定でも終わるように、たどるのは1週間分まで
+        limit = now + timedelta(days=8)
+        while end < limit:
+            next_concurrency, next_end = self._window_at(end)
+            if next_concurrency == 0 or next_end <= end:
+                break
+            end = next_end
+
+        for window in self.windows:
+            if window.concurrency == 0:
+                start = window.next_start(now)
+                if start is not None and start < end:
+                    end = start
+        return (concurrency, min(end, limit))
+
+    def _window_at(self, now):
+        # type: (datetime) -> tuple
+        """now を含む時間帯の (同時実行数, 終了時刻)。隣接する時間帯はたどらない"""
+        best = (0, None)
+        for window in self.windows:
+            occurrence = window.occurrence(now)
+            if occurrence is None:
+                continue
+            if window.concurrency == 0:
+                return (0, None)
+            if best[1] is None or window.concurrency > best[0]:
+                best = (window.concurrency, occurrence[1])
+        return best
+
+    def concurrency(self, now=None):
+        # type: (datetime) -> int
+        """現在の同時実行数（時間帯の外では 0）"""
+        return self.current(now)[0]
+
+    def can_start(self, now=None):
+        # type: (datetime) -> bool
+        """新しいプロジェクトや設計ポイントを開始してよいか"""
+        now = now or datetime.now()
+        concurrency, end = self.current(now)
+        return concurrency > 0 and end - now > self.stop_margin
+
+    def next_opening(self, now=None):
+        # type: (datetime) -> datetime
+        """
+        次に作業を開始できる時刻
+
+        稼働時間帯の始まりに加え、長い時間帯の途中にある停止時間帯の終わり
+        （08:00-18:00 の中の 12:00-13:00 なら 13:00）も候補とする
+        """
+        now = now or datetime.now()
+        candidates = []
+        for window in self.windows:
+            if window.concurrency > 0:
+                candidates.append(window.next_start(now))
+            else:
+                candidates.append(window.next_end(now))
+        for candidate in sorted(c for c in candidates if c is not None):
+            if self._window_at(candidate)[0] > 0:
+                return candidate
+        return None
+
+    def wait_for_window(self, progress=None):
+        # type: (ProgressReporter) -> int
+        """
+        作業を開始できる時間帯になるまで待つ
+
+        Args:
+            progress (ProgressReporter): 待機中の状態を公開する場合に指定（オプション）
+
+        Returns:
+            int: 待機後の同時実行数
+        """
+        if self.can_start():
+            return self.concurrency()
+
+        opening = self.next_opening()
+        self.logger.info("Outside run window; paused until {}".format(
+            opening.strftime("%Y-%m-%d %H:%M") if opening else "the next window"
+        ))
+        if progress is not None:
+            progress.set_state("paused")
+
+        wait_start = time.time()
+        while not self.can_start():
+            delay = self.check_interval
+            if opening is not None:
+                remaining = (opening - datetime.now()).total_seconds()
+                if remaining > 0:
+                    delay = min(delay, remaining)
+            time.sleep(delay)
+
+        self.paused_seconds += time.time() - wait_start
+        self.pause_count += 1
+        if progress is not None:
+            progress.set_state("running")
+
+        concurrency = self.concurrency()
+        self.logger.info("Run window opened; resuming with concurrency {}".format(concurrency))
+        return concurrency
+
+    def format_section(self):
+        # type: () -> str
+        """全体完了通知に載せる待機時間の統計"""
+        lines = []
+        lines.append("稼働時間帯:")
+        lines.append("  待機: {} 回".format(self.pause_count))
+        lines.append("  待機時間: {}".format(timedelta(seconds=int(self.paused_seconds))))
+        return "\n".join(lines)
+
+
+def parse_window(window):
+    # type: (dict) -> RunWindow
+    """
+    設定の時間帯を RunWindow に変換
+
+    Args:
+        window (dict): {"days": "mon-fri", "start": "19:00", "end": "07:00", "concurrency": 1}
+            days は "mon-fri" のような範囲、"sat,sun" のような列挙、"daily"、またはそれらのリスト
+
+    Returns:
+        RunWindow: 稼働時間帯
+    """
+    start = _parse_time(window.get("start", "00:00"))
+    end = _parse_time(window.get("end", "24:00"))
+    concurrency = int(window.get("concurrency", 1))
+    if concurrency < 0:
+        raise ValueError("Invalid concurrency in run window: {}".format(concurrency))
+    return RunWindow(_parse_days(window.get("days", "daily")), start, end, concurrency)
+
+
+def _parse_days(spec):
+    # type: (object) -> set
+    """曜日の指定を weekday() の値の集合に変換"""
+    if isinstance(spec, (list, tuple)):
+        parts = []
+        for item in spec:
+            parts.extend(str(item).split(","))
+    else:
+        parts = str(spec).split(",")
+
+    days = set()
+    for part in parts:
+        part = part.strip().lower()
+        if not part:
+            continue
+        if part in ("daily", "*", "all"):
+            days.update(range(7))
+        elif "-" in part:
+            first, last = [_day_index(name) for name in part.split("-", 1)]
+            day = first
+            days.add(day)
+            while day != last:
+                day = (day + 1) % 7
+                days.add(day)
+        else:
+            days.add(_day_index(part))
+    return days
+
+
+def _day_index(name):
+    # type: (str) -> int
+    key = name.strip().lower()[:3]
+    if key not in _DAY_NAMES:
+        raise ValueError("Invalid day in run window: {}".format(name))
+    return _DAY_NAMES.index(key)
+
+
+def _parse_time(text):
+    # type: (str) -> int
+    """"HH:MM" を 0:00 からの分に変換（"24:00" も可）"""
+    try:
+        hour, minute = [int(part) for part in str(text).split(":")]
+    except ValueError:
+        raise ValueError("Invalid time in run window: {}".format(text))
+    if not (0 <= hour <= 24 and 0 <= minute < 60) or (hour == 24 and minute != 0):
+        raise ValueError("Invalid time in run window: {}".format(text))
+    return hour * 60 + minute
@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+"""
+分散実行の作業キュー
+
+複数のソルバーノードが共有フォルダ上のキューからプロジェクトを1つずつ取り出して処理する
+SQLite は IronPython で使えず、共有フォルダ上ではロックも信頼できないため、
+排他作成 (O_EXCL) したファイルをリース（貸し出し）として使う
+
+ディレクトリ構成 ({queue_dir}/{batch_id}/):
+    seed.lock           最初のノードが作成し、タスクを登録する
+    batch.json          登録済みのタスク一覧（これがあれば登録完了）
+    tasks/{id}.json     タスク（PROJECTS のエントリ）
+    leases/{id}.lease   処理中のノード。更新時刻 (mtime) をハートビートで延長する
+    leases/{id}.steal   期限切れリースの回収中を示すロック
+    expired/            回収した期限切れリース（試行回数の記録）
+    results/{id}.{node}.json  処理結果
+    summary.lock        全体完了通知を送るノードが作成する
+
+リースの期限はファイルの更新時刻で判定するため、各ノードの時刻は NTP などで合わせておくこと
+
+batch_id は DISTRIBUTED_CONFIG の batch_id、または run_tag と PROJECTS のハッシュから決める
+（起動日などから自動で決めると、日付をまたいで起動したノードが別のキューに入ってしまうため）
+"""
+
+import os
+import json
+import hashlib
+import time
+import socket
+import logging
+import threading
+from datetime import datetime
+
+from config import DISTRIBUTED_CONFIG
+from fs_utils import read_json, write_json_atomic
+
+
+class WorkQueue(object):
+    """
+    共有フォルダ上の作業キュー
+
+    最初のノードが try_seed() / seed() でタスクを登録し、
+    各ノードは wait_until_ready() の後、claim() で取り出したタスクを処理して complete() で結果を書き込む
+    処理中は lease_held() でリースを失っていないか確認し、失った場合はプロジェクトを保存しない
+    全タスクの完了後、elect_summary() で選ばれた1ノードが collect_results() で全体の結果を集める
+
+    共有フォルダの一時的な I/O エラーは io_retries 回まで再試行し、
+    それでも失敗した場合は次の確認まで待って処理を続ける
+    """
+    def __init__(self, logger, projects):
+        # type: (logging.Logger, list) -> None
+        """
+        Args:
+            logger (logging.Logger): ロガーインスタンス
+            projects (list): PROJECTS（batch_id を run_tag から決める場合にハッシュを取る）
+
+        Raises:
+            ValueError: batch_id と run_tag のどちらも設定されていない場合
+        """
+        self.logger = logger
+        self.root = os.path.join(DISTRIBUTED_CONFIG["queue_dir"], get_batch_id(projects))
+        self.node = DISTRIBUTED_CONFIG.get("node_name") or "{}-{}".format(
+            socket.gethostname(), os.getpid()
+        )
+        self.lease_seconds = DISTRIBUTED_CONFIG.get("lease_seconds", 600)
+        self.heartbeat_seconds = DISTRIBUTED_CONFIG.get("heartbeat_seconds", 60)
+        self.poll_seconds = DISTRIBUTED_CONFIG.get("poll_seconds", 30)
+        self.max_attempts = DISTRIBUTED_CONFIG.get("max_attempts", 3)
+        self.io_retries = max(1, DISTRIBUTED_CONFIG.get("io_retries", 3))
+        self.io_retry_seconds = DISTRIBUTED_CONFIG.get("io_retry_seconds", 5)
+
+        self.tasks_dir = os.path.join(self.root, "tasks")
+        self.leases_dir = os.path.join(self.root, "leases")
+        self.expired_dir = os.path.join(self.root, "expired")
+        self.results_dir = os.path.join(self.root, "results")
+        for directory in (self.tasks_dir, self.leases_dir, self.expired_dir, self.results_dir):
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    # 他のノードが同時に作成した場合
+                    if not os.path.isdir(directory):
+                        raise
+
+        self.task_ids = []  # type: list
+        self.seeded = False
+        self._lock = threading.Lock()
+        self._held = {}  # type: dict  # task_id -> リースのトークン
+        self._current = None  # type: dict
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    # ------------------------------------------------------------
+    # タスクの登録
+    # ------------------------------------------------------------
+
+    def try_seed(self):
+        # type: () -> bool
+        """このノードがタスクを登録する役になれば True"""
+        return _create_exclusive(os.path.join(self.root, "seed.lock"), {
+            "node": self.node,
+            "created": _now_text(),
+        })
+
+    def seed(self, entries, dropped_results=None):
+        # type: (list, list) -> None
+        """
+        タスクを登録
+
+        Args:
+            entries (list): 実行する PROJECTS のエントリ（実行順）
+            dropped_results (list): 事前チェックで除外したプロジェクトの処理結果（全体完了通知に含める）
+        """
+        task_ids = []
+        for number, entry in enumerate(entries, 1):
+            task_id = "{:04d}".format(number)
+            write_json_atomic(os.path.join(self.tasks_dir, task_id + ".json"), {
+                "task_id": task_id,
+                "entry": entry,
+            })
+            task_ids.append(task_id)
+
+        write_json_atomic(os.path.join(self.root, "batch.json"), {
+            "seeded_by": self.node,
+            "created": _now_text(),
+            "tasks": task_ids,
+            "dropped_results": dropped_results or [],
+        })
+        self.seeded = True
+        self.logger.info("Seeded work queue {} with {} project(s)".format(self.root, len(task_ids)))
+
+    def wait_until_ready(self):
+        # type: () -> bool
+        """
+        タスクの登録完了を待つ
+
+        Returns:
+            bool: 登録が完了した場合 True
+                登録するノードが lease_seconds 以上応答しない場合や、
+                他のノードが登録したキューが既に全て完了している場合は False
+        """
+        batch_file = os.path.join(self.root, "batch.json")
+        seed_lock = os.path.join(self.root, "seed.lock")
+        while not os.path.exists(batch_file):
+            if self._is_expired(seed_lock):
+                self.logger.error("Work queue {} was never seeded; remove {} to retry".format(
+                    self.root, seed_lock
+                ))
+                return False
+            time.sleep(min(self.poll_seconds, 5))
+        self.task_ids = read_json(batch_file, {}).get("tasks", [])
+        if not self.seeded and self.all_done():
+            # 前回の実行と同じ batch_id / run_tag のまま起動した場合
+            self.logger.error(
+                "Work queue {} is already complete; set a new run_tag or batch_id "
+                "to start another run".format(self.root)
+            )
+            return False
+        self.logger.info("Joined work queue {} as {} ({} project(s))".format(
+            self.root, self.node, len(self.task_ids)
+        ))
+        return True
+
+    # ------------------------------------------------------------
+    # タスクの取り出しと完了
+    # ------------------------------------------------------------
+
+    def start(self):
+        # type: () -> None
+        """ハートビートのスレッドを開始"""
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat")
+        self._heartbeat.daemon = True
+        self._heartbeat.start()
+
+    def close(self):
+        # type: () -> None
+        """ハートビートのスレッドを停止"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def __iter__(self):
+        return self.entries()
+
+    def entries(self, before_claim=None):
+        """
+        タスクを1つずつ取り出し、PROJECTS のエントリを返す
+
+        処理後は complete() を呼ぶこと
+        他のノードが処理中のタスクしか残っていない場合は、完了か期限切れを待つ
+
+        Args:
+            before_claim (callable): タスクを取り出す前に呼ぶ関数（稼働時間帯まで待つなど）
+                待っている間はリースを持たないため、他のノードがタスクを取り出せる
+        """
+        while True:
+            if before_claim is not None:
+                before_claim()
+            task = self.claim()
+            if task is not None:
+                yield task["entry"]
+                continue
+            if self.all_done():
+                return
+            time.sleep(self.poll_seconds)
+
+    def claim(self):
+        # type: () -> dict
+        """
+        未処理のタスクを1つ取り出してリースを取得
+
+        Returns:
+            dict: タスク。取り出せるタスクがない場合（共有フォルダを読めない場合を含む）は None
+        """
+        try:
+            # results/ の一覧は1回の確認につき1度だけ取得する
+            done = self._retry(self._completed_task_ids)
+        except (IOError, OSError) as e:
+            self.logger.warning("Failed to read work queue results: {}".format(str(e)))
+            return None
+
+        for task_id in self.task_ids:
+            if task_id in done:
+                continue
+            try:
+                task = self._try_claim(task_id)
+            except (IOError, OSError) as e:
+                self.logger.warning("Failed to claim {} from work queue: {}".format(
+                    task_id, str(e)
+                ))
+                continue
+            if task is not None:
+                return task
+        return None
+
+    def _try_claim(self, task_id):
+        # type: (str) -> dict
+        """1つのタスクのリースを取得してタスクを返す。取得できない場合は None"""
+        lease_path = self._lease_path(task_id)
+        if os.path.exists(lease_path) and not self._reclaim_expired(task_id):
+            return None
+
+        token = "{}-{}".format(self.node, time.time())
+        if not _create_exclusive(lease_path, {
+            "node": self.node,
+            "token": token,
+            "acquired": _now_text(),
+        }):
+            return None
+
+        try:
+            # リースを取った直後に他のノードが結果を書いていた場合
+            if task_id in self._completed_task_ids():
+                self._release(task_id, token)
+                return None
+
+            attempts = self._count_attempts(task_id)
+            task = read_json(os.path.join(self.tasks_dir, task_id + ".json"), None)
+            if task is None:
+                self._release(task_id, token)
+                return None
+        except (IOError, OSError):
+            # 期限切れを待たずに他のノードが取り出せるよう、リースを返してから再送出する
+            self._release(task_id, token)
+            raise
+
+        with self._lock:
+            self._held[task_id] = token
+        self._current = task
+
+        if attempts >= self.max_attempts:
+            # 処理中のノードが何度も応答しなくなったプロジェクトは失敗として扱う
+            self.logger.error("Giving up on {} after {} expired lease(s)".format(
+                task["entry"], attempts
+            ))
+            self.complete(_failed_result(
+                task["entry"], "Lease expired {} times".format(attempts)
+            ))
+            return None
+
+        self.logger.info("Claimed {} from work queue (attempt {})".format(
+            task_id, attempts + 1
+        ))
+        return task
+
+    def lease_held(self):
+        # type: () -> bool
+        """
+        取り出し中のタスクのリースをまだ保持しているか
+
+        期限切れで他のノードに回収された場合は False
+        共有フォルダを読めずに確認できない場合も、二重に保存しないよう False とする
+        """
+        task = self._current
+        if task is None:
+            return False
+        task_id = task["task_id"]
+        with self._lock:
+            token = self._held.get(task_id)
+        if token is None:
+            return False
+
+        try:
+            lease = self._retry(_read_lease, self._lease_path(task_id))
+        except (IOError, OSError) as e:
+            self.logger.warning("Failed to check lease for {}: {}".format(task_id, str(e)))
+            return False
+        if lease is not None and lease.get("token") == token:
+            return True
+
+        with self._lock:
+            lost = self._held.pop(task_id, None) is not None
+        if lost:
+            self.logger.warning("Lease for {} was lost".format(task_id))
+        return False
+
+    def complete(self, result):
+        # type: (dict) -> bool
+        """
+        取り出し中のタスクの処理結果を書き込み、リースを返す
+
+        リースを失っていた場合は、回収したノードの結果を優先するため書き込まない
+
+        Returns:
+            bool: 結果を書き込んだ場合 True
+        """
+        task = self._current
+        if task is None:
+            return False
+        task_id = task["task_id"]
+        with self._lock:
+            token = self._held.get(task_id)
+        if not self.lease_held():
+            self._current = None
+            self.logger.warning("Discarding result for {}: lease was lost".format(task_id))
+            return False
+        self._current = None
+
+        data = dict(result)
+        data["task_id"] = task_id
+        data["node"] = self.node
+        data["token"] = token
+        data["completed"] = _now_text()
+        try:
+            self._retry(write_json_atomic, os.path.join(
+                self.results_dir, "{}.{}.json".format(task_id, _safe_name(self.node))
+            ), data)
+        except (IOError, OSError) as e:
+            # リースは延長せずに残し、期限切れ後に他のノードが処理し直す
+            with self._lock:
+                self._held.pop(task_id, None)
+            self.logger.error("Failed to write result for {}: {}".format(task_id, str(e)))
+            return False
+
+        with self._lock:
+            self._held.pop(task_id, None)
+        self._release(task_id, token)
+        return True
+
+    def remaining_count(self):
+        # type: () -> int
+        """結果がまだ書き込まれていないタスクの数（共有フォルダを読めない場合は None）"""
+        try:
+            done = self._retry(self._completed_task_ids)
+        except (IOError, OSError) as e:
+            self.logger.warning("Failed to read work queue results: {}".format(str(e)))
+            return None
+        return len([task_id for task_id in self.task_ids if task_id not in done])
+
+    def all_done(self):
+        # type: () -> bool
+        """全タスクの結果が揃ったか（共有フォルダを読めない場合は False）"""
+        try:
+            done = self._retry(self._completed_task_ids)
+        except (IOError, OSError) as e:
+            self.logger.warning("Failed to read work queue results: {}".format(str(e)))
+            return False
+        return all(task_id in done for task_id in self.task_ids)
+
+    # ------------------------------------------------------------
+    # 全体完了通知
+    # ------------------------------------------------------------
+
+    def elect_summary(self):
+        # type: () -> bool
+        """全体完了通知を送るノードに選ばれれば True（最初に呼んだ1ノードのみ）"""
+        return _create_exclusive(os.path.join(self.root, "summary.lock"), {
+            "node": self.node,
+            "created": _now_text(),
+        })
+
+    def collect_results(self):
+        # type: () -> list
+        """
+        全ノードの処理結果をタスク順に集める
+
+        同じタスクに複数の結果がある場合（期限切れで回収される前に元のノードも書き込んだ場合など）は、
+        成功した結果を優先し、その中では最後に書き込まれた（最新のリースの）結果を使う
+        """
+        try:
+            filenames = self._retry(os.listdir, self.results_dir)
+        except (IOError, OSError) as e:
+            self.logger.error("Failed to read work queue results: {}".format(str(e)))
+            filenames = []
+
+        by_task = {}
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+            result = read_json(os.path.join(self.results_dir, filename), None)
+            if not result or "task_id" not in result:
+                continue
+            current = by_task.get(result["task_id"])
+            if current is None or _result_rank(result) > _result_rank(current):
+                by_task[result["task_id"]] = result
+
+        results = [by_task[task_id] for task_id in self.task_ids if task_id in by_task]
+        batch = read_json(os.path.join(self.root, "batch.json"), {})
+        results.extend(batch.get("dropped_results", []))
+        return results
+
+    # ------------------------------------------------------------
+    # リース
+    # ------------------------------------------------------------
+
+    def _heartbeat_loop(self):
+        # type: () -> None
+        """処理中のタスクのリースの更新時刻を定期的に延長"""
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._lock:
+                held = list(self._held.items())
+            for task_id, token in held:
+                try:
+                    lease = _read_lease(self._lease_path(task_id))
+                    if lease is None or lease.get("token") != token:
+                        # 処理側は lease_held() で検知して保存と結果の書き込みを止める
+                        with self._lock:
+                            if self._held.get(task_id) == token:
+                                del self._held[task_id]
+                        self.logger.warning("Lease for {} was lost".format(task_id))
+                        continue
+                    os.utime(self._lease_path(task_id), None)
+                except (IOError, OSError) as e:
+                    self.logger.warning("Failed to renew lease for {}: {}".format(task_id, str(e)))
+
+    def _reclaim_expired(self, task_id):
+        # type: (str) -> bool
+        """
+        期限切れのリースを回収
+
+        回収中のロック ({id}.steal) を排他作成したノードだけが回収する
+
+        Returns:
+            bool: リースを回収した（取得を試みてよい）場合 True
+        """
+        lease_path = self._lease_path(task_id)
+        if not self._is_expired(lease_path):
+            return False
+
+        steal_path = os.path.join(self.leases_dir, task_id + ".steal")
+        if not _create_exclusive(steal_path, {"node": self.node, "created": _now_text()}):
+            # 回収中のノードが異常終了した場合に備え、古いロックは消す
+            if self._is_expired(steal_path):
+                _remove_quietly(steal_path)
+            return False
+
+        try:
+            # ロックを取ってから改めて確認する
+            if not self._is_expired(lease_path):
+                return False
+            lease = read_json(lease_path, {})
+            expired_path = os.path.join(self.expired_dir, "{}.{}.{}.lease".format(
+                task_id, _safe_name(self.node), int(time.time() * 1000)
+            ))
+            try:
+                os.rename(lease_path, expired_path)
+            except OSError:
+                return False
+            self.logger.warning("Reclaimed expired lease for {} held by {}".format(
+                task_id, lease.get("node", "unknown")
+            ))
+            return True
+        finally:
+            _remove_quietly(steal_path)
+
+    def _is_expired(self, path):
+        # type: (str) -> bool
+        """最後の更新 (mtime) から lease_seconds を過ぎたか"""
+        try:
+            return time.time() - os.path.getmtime(path) > self.lease_seconds
+        except OSError:
+            return False
+
+    def _release(self, task_id, token):
+        # type: (str, str) -> None
+        """自分のリースであれば削除"""
+        lease_path = self._lease_path(task_id)
+        lease = read_json(lease_path, None)
+        if lease is not None and lease.get("token") == token:
+            _remove_quietly(lease_path)
+
+    def _count_attempts(self, task_id):
+        # type: (str) -> int
+        """期限切れになったリースの数（これまでの試行回数）"""
+        prefix = task_id + "."
+        return len([name for name in os.listdir(self.expired_dir) if name.startswith(prefix)])
+
+    def _completed_task_ids(self):
+        # type: () -> set
+        """結果が書き込まれたタスクの ID"""
+        return set(name.split(".", 1)[0] for name in os.listdir(self.results_dir)
+                   if name.endswith(".json"))
+
+    def _retry(self, func, *args):
+        """共有フォルダの一時的な I/O エラーを io_retries 回まで再試行"""
+        for attempt in range(1, self.io_retries + 1):
+            try:
+                return func(*args)
+            except (IOError, OSError) as e:
+                if attempt >= self.io_retries:
+                    raise
+                self.logger.warning("Work queue I/O error (attempt {}/{}): {}".format(
+                    attempt, self.io_retries, str(e)
+                ))
+                time.sleep(self.io_retry_seconds)
+
+    def _lease_path(self, task_id):
+        # type: (str) -> str
+        return os.path.join(self.leases_dir, task_id + ".lease")
+
+
+def node_file_path(path):
+    # type: (str) -> str
+    """
+    ノードごとに分けるファイルのパス
+
+    分散実行ではログディレクトリを共有することがあるため、ステータスファイルや実行履歴などの
+    ノードごとのファイル名にノード名を付ける（status.json -> status.{ノード名}.json）
+    ノード名が未設定の場合は、再起動しても同じ名前になるようホスト名を使う
+    分散実行でない場合は path をそのまま返す
+    """
+    if not DISTRIBUTED_CONFIG.get("enabled", False):
+        return path
+    root, ext = os.path.splitext(path)
+    return "{}.{}{}".format(root, get_node_label(), ext)
+
+
+def get_node_label():
+    # type: () -> str
+    """ファイル名に使うノード名（node_name、未設定の場合はホスト名）"""
+    return _safe_name(DISTRIBUTED_CONFIG.get("node_name") or socket.gethostname())
+
+
+def get_batch_id(projects):
+    # type: (list) -> str
+    """
+    作業キューの batch_id
+
+    batch_id が設定されていればそのまま使い、なければ "{run_tag}-{PROJECTS のハッシュ}" とする
+    全ノードで同じ設定を使えば同じキューに入り、run_tag か PROJECTS を変えると新しいキューになる
+
+    Raises:
+        ValueError: batch_id と run_tag のどちらも設定されていない場合
+    """
+    batch_id = DISTRIBUTED_CONFIG.get("batch_id")
+    if batch_id:
+        return str(batch_id)
+    run_tag = DISTRIBUTED_CONFIG.get("run_tag")
+    if not run_tag:
+        raise ValueError("Set batch_id or run_tag so that all nodes join the same work queue")
+    text = json.dumps(projects, sort_keys=True)
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return "{}-{}".format(_safe_name(str(run_tag)), digest)
+
+
+def _create_exclusive(path, data):
+    # type: (str, dict) -> bool
+    """
+    ファイルを排他作成 (O_EXCL) して data を書き込む
+
+    Returns:
+        bool: 作成できた場合 True、既に存在する場合 False
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        if os.path.exists(path):
+            return False
+        raise
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    return True
+
+
+def _read_lease(path):
+    # type: (str) -> dict
+    """
+    リースファイルを読み込む
+
+    Returns:
+        dict: リースの内容。ファイルがない場合は None、書き込み途中の場合は空の dict
+
+    Raises:
+        IOError, OSError: 共有フォルダを読めない場合
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _result_rank(result):
+    # type: (dict) -> tuple
+    """同じタスクの結果のうちどれを使うかの順位（大きい方を使う）"""
+    return (bool(result.get("success")), result.get("completed", ""))
+
+
+def _failed_result(entry, error):
+    # type: (object, str) -> dict
+    """処理できなかったタスクの処理結果"""
+    path = entry["path"] if isinstance(entry, dict) else entry
+    return {
+        "project": os.path.basename(path),
+        "success": False,
+        "error": error,
+        "dp_total": 0,
+        "dp_success": 0,
+        "path": path,
+    }
+
+
+def _remove_quietly(path):
+    # type: (str) -> None
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _safe_name(name):
+    # type: (str) -> str
+    """ファイル名に使えない文字を置き換える"""
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+
+
+def _now_text():
+    # type: () -> str
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+スレッドプール
+
+IronPython 2.7 でも動作する最小限のワーカープール
+concurrent.futures が使えない環境向けに threading と Queue のみで実装
+"""
+
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Task(object):
+    """
+    プールに投入された1件の処理
+
+    完了待ちと結果（または例外）の取得に使う
+    """
+    def __init__(self, func, args, kwargs):
+        # type: (callable, tuple, dict) -> None
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def run(self):
+        # type: () -> None
+        """処理を実行して結果を保持"""
+        try:
+            self._result = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+        finally:
+            self._done.set()
+
+    def done(self):
+        # type: () -> bool
+        """完了済みか"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        # type: (float) -> bool
+        """完了を待つ。タイムアウト時は False"""
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def exception(self):
+        # type: () -> Exception
+        """処理中に発生した例外（なければ None）"""
+        self._done.wait()
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def result(self):
+        # type: () -> object
+        """処理結果を取得。例外が発生していた場合は再送出"""
+        self._done.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+        return self._result
+
+
+class WorkerPool(object):
+    """
+    固定数のワーカースレッドで処理を並列実行するプール
+
+    ワーカーはデーモンスレッドのため、shutdown を呼ばずに
+    プロセスが終了しても終了をブロックしない
+    """
+    def __init__(self, max_workers, name="worker"):
+        # type: (int, str) -> None
+        self.max_workers = max(1, int(max_workers))
+        self.name = name
+        self._queue = queue.Queue()
+        self._threads = []  # type: list
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, func, *args, **kwargs):
+        # type: (callable, *object, **object) -> Task
+        """処理を投入し Task を返す"""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("WorkerPool '{}' is already shut down".format(self.name))
+            task = Task(func, args, kwargs)
+            self._queue.put(task)
+            if len(self._threads) < self.max_workers:
+                self._start_thread()
+        return task
+
+    def map(self, func, items):
+        # type: (callable, list) -> list
+        """各要素に func を適用し、入力順に結果を返す"""
+        tasks = [self.submit(func, item) for item in items]
+        return [task.result() for task in tasks]
+
+    def shutdown(self, wait=True):
+        # type: (bool) -> None
+        """新規投入を止め、必要なら投入済みの処理の完了を待つ"""
+        with self._lock:
+            if self._shutdown:
+                threads = []
+            else:
+                self._shutdown = True
+                threads = list(self._threads)
+                for _ in threads:
+                    self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _start_thread(self):
+        # type: () -> None
+        thread = threading.Thread(
+            target=self._worker,
+            name="{}-{}".format(self.name, len(self._threads) + 1)
+        )
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _worker(self):
+        # type: () -> None
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            task.run()